@@ -15,6 +15,11 @@ else:
 
 CONFIG_FILE = os.path.join(application_path, 'managed_scripts.json')
 SETTINGS_FILE = os.path.join(application_path, 'app_settings.json')
+CACHE_DIR = os.path.join(application_path, 'cache')
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, 'http')
+REPO_METADATA_FILE = os.path.join(CACHE_DIR, 'repo_metadata.json')
+DOWNLOADS_DIR = os.path.join(CACHE_DIR, 'downloads')
+MANIFESTS_DIR = os.path.join(CACHE_DIR, 'manifests')
 
 def load_scripts_config():
     """Loads the managed scripts configuration from the JSON file."""
@@ -130,3 +135,101 @@ def set_update_method(method):
     settings = load_settings()
     settings['update_method'] = method
     save_settings(settings)
+
+def get_http_pool_settings():
+    """Gets the HTTP connection pool sizes used for GitHub traffic ('http_pool' in app settings).
+    Read once, when the shared HTTP client is created at first use."""
+    settings = load_settings()
+    pool = {'connections': 10, 'maxsize': 20, 'per_host': 6}
+    pool.update(settings.get('http_pool', {}))
+    return pool
+
+def get_update_check_workers():
+    """Gets the number of scripts checked in parallel during the startup update check."""
+    settings = load_settings()
+    return settings.get('update_check_workers', 8)
+
+def set_update_check_workers(workers):
+    """Sets the number of scripts checked in parallel during the startup update check."""
+    settings = load_settings()
+    settings['update_check_workers'] = workers
+    save_settings(settings)
+
+def get_repo_metadata_ttl():
+    """Gets how long (in seconds) cached repository metadata stays valid."""
+    settings = load_settings()
+    return settings.get('repo_metadata_ttl', 24 * 60 * 60)
+
+def set_repo_metadata_ttl(seconds):
+    """Sets how long (in seconds) cached repository metadata stays valid."""
+    settings = load_settings()
+    settings['repo_metadata_ttl'] = seconds
+    save_settings(settings)
+
+def get_download_settings():
+    """Gets download tuning: in-memory spool threshold, copy chunk size (bytes) and parallel asset downloads."""
+    settings = load_settings()
+    download = {'spool_threshold': 16 * 1024 * 1024, 'chunk_size': 64 * 1024, 'asset_workers': 4}
+    download.update(settings.get('download', {}))
+    return download
+
+def set_download_settings(spool_threshold, chunk_size, asset_workers=4):
+    """Sets download tuning: in-memory spool threshold, copy chunk size (bytes) and parallel asset downloads."""
+    settings = load_settings()
+    settings['download'] = {'spool_threshold': spool_threshold, 'chunk_size': chunk_size, 'asset_workers': asset_workers}
+    save_settings(settings)
+
+def get_archive_engine():
+    """Gets the repository archive engine used for folder downloads ('zipball' or 'tarball')."""
+    settings = load_settings()
+    return settings.get('archive_engine', 'zipball')
+
+def set_archive_engine(engine):
+    """Sets the repository archive engine used for folder downloads ('zipball' or 'tarball')."""
+    settings = load_settings()
+    settings['archive_engine'] = engine
+    save_settings(settings)
+
+def get_archive_format():
+    """Gets how archived versions are stored: 'store' (deduplicated blobs) or 'pack' (one zip per version)."""
+    settings = load_settings()
+    return settings.get('archive_format', 'store')
+
+def set_archive_format(archive_format):
+    """Sets how archived versions are stored: 'store' (deduplicated blobs) or 'pack' (one zip per version)."""
+    settings = load_settings()
+    settings['archive_format'] = archive_format
+    save_settings(settings)
+
+def get_retention_policy():
+    """Gets the global retention policy for archived versions.
+
+    Returns:
+        dict: keep_last (newest N versions), keep_daily / keep_weekly (newest version of
+        each of the last N days / weeks that have one) and max_bytes (disk budget).
+        None means no limit; scripts can override keys with their own 'retention' entry.
+    """
+    settings = load_settings()
+    policy = {'keep_last': None, 'keep_daily': None, 'keep_weekly': None, 'max_bytes': None}
+    policy.update(settings.get('retention', {}))
+    return policy
+
+def set_retention_policy(keep_last=None, keep_daily=None, keep_weekly=None, max_bytes=None):
+    """Sets the global retention policy for archived versions (None means no limit)."""
+    settings = load_settings()
+    settings['retention'] = {'keep_last': keep_last, 'keep_daily': keep_daily,
+                             'keep_weekly': keep_weekly, 'max_bytes': max_bytes}
+    save_settings(settings)
+
+def get_archive_link_mode():
+    """Gets how archived files are snapshotted: 'auto' (reflink on ReFS/Dev Drive or btrfs/XFS, else copy), 'reflink',
+    'hardlink' (opt-in; in-place writes to installed files then also change the archive) or 'copy'."""
+    settings = load_settings()
+    return settings.get('archive_link_mode', 'auto')
+
+def set_archive_link_mode(mode):
+    """Sets how archived files are snapshotted: 'auto' (reflink on ReFS/Dev Drive or btrfs/XFS, else copy), 'reflink',
+    'hardlink' (opt-in; in-place writes to installed files then also change the archive) or 'copy'."""
+    settings = load_settings()
+    settings['archive_link_mode'] = mode
+    save_settings(settings)
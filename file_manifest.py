@@ -0,0 +1,184 @@
+import os
+import json
+import hashlib
+import threading
+import config_manager
+import hashing
+from logger_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Folders under a script's install that are never part of its manifest.
+_EXCLUDED_DIRS = {"Older Versions"}
+
+
+class FileManifest:
+    """Per-script record of installed files: relative path, size, mtime_ns and content hashes.
+
+    A file whose size and mtime_ns still match its entry is taken to be
+    unchanged, so its cached hash is reused instead of reading the file
+    again; differential comparisons then only read files that actually
+    changed. Hashes are kept per algorithm ('git' blob SHA-1, 'sha256',
+    'crc32') and filled in lazily. The manifest lives in the app cache, keyed
+    by the script's install path, and is saved atomically.
+    """
+
+    def __init__(self, root, manifest_path):
+        self.root = root
+        self.manifest_path = manifest_path
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    data = json.load(f)
+                if data.get('root') == os.path.abspath(root):
+                    self._entries = data.get('files', {})
+            except (json.JSONDecodeError, IOError) as e:
+                logger.debug(f"Ignoring unreadable manifest {manifest_path}: {e}")
+
+    def _local_path(self, rel_path):
+        return os.path.join(self.root, rel_path.replace('/', os.sep))
+
+    def _current_entry(self, rel_path, st):
+        # Caller holds the lock. Returns the entry if it still describes the file on disk.
+        entry = self._entries.get(rel_path)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return entry
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hashes': {}}
+        self._entries[rel_path] = entry
+        self._dirty = True
+        return entry
+
+    def get_hash(self, rel_path, algo='git'):
+        """Returns the file's hash, reading it only if it changed since it was last hashed.
+
+        Returns:
+            str or None: The hex digest, or None if the file doesn't exist or can't be read.
+        """
+        local_path = self._local_path(rel_path)
+        try:
+            st = os.stat(local_path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._current_entry(rel_path, st)['hashes'].get(algo)
+        if cached:
+            return cached
+        try:
+            digest = hashing.hash_file(local_path, algo)
+        except (IOError, OSError) as e:
+            logger.error(f"Error hashing {local_path}: {e}")
+            return None
+        with self._lock:
+            self._current_entry(rel_path, st)['hashes'][algo] = digest
+            self._dirty = True
+        return digest
+
+    def get_hashes(self, rel_paths, algo='git', expected_sizes=None):
+        """Returns {rel_path: hash} for a batch of files, hashing the stale ones in parallel.
+
+        Files that are missing, unreadable, or whose size differs from
+        expected_sizes[rel_path] are left out without being read.
+        """
+        hashes = {}
+        stale = {}  # local path -> (rel_path, stat)
+        with self._lock:
+            for rel_path in rel_paths:
+                local_path = self._local_path(rel_path)
+                try:
+                    st = os.stat(local_path)
+                except OSError:
+                    continue
+                if expected_sizes is not None and st.st_size != expected_sizes.get(rel_path):
+                    continue
+                cached = self._current_entry(rel_path, st)['hashes'].get(algo)
+                if cached:
+                    hashes[rel_path] = cached
+                else:
+                    stale[local_path] = (rel_path, st)
+        if stale:
+            digests = hashing.hash_files(stale, algo)
+            with self._lock:
+                for local_path, (rel_path, st) in stale.items():
+                    if digests[local_path]:
+                        self._current_entry(rel_path, st)['hashes'][algo] = digests[local_path]
+                        self._dirty = True
+                        hashes[rel_path] = digests[local_path]
+        return hashes
+
+    def record(self, rel_path, algo, digest):
+        """Stores a hash already known for a file that was just written (e.g. a verified blob)."""
+        try:
+            st = os.stat(self._local_path(rel_path))
+        except OSError:
+            return
+        with self._lock:
+            self._entries[rel_path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hashes': {algo: digest}}
+            self._dirty = True
+
+    def clear(self):
+        """Forgets every entry, e.g. after the whole tree was replaced."""
+        with self._lock:
+            self._entries = {}
+            self._dirty = True
+
+    def refresh(self, algo='git'):
+        """Brings the manifest in line with the files on disk.
+
+        Entries for deleted files are dropped and every new or changed file is
+        hashed (in parallel); unchanged files only cost a stat.
+        """
+        seen = set()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            if dirpath == self.root:
+                dirnames[:] = [d for d in dirnames if d not in _EXCLUDED_DIRS]
+            for filename in filenames:
+                seen.add(os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/'))
+        self.get_hashes(seen, algo)
+        with self._lock:
+            for rel_path in set(self._entries) - seen:
+                del self._entries[rel_path]
+                self._dirty = True
+
+    def save(self):
+        """Writes the manifest atomically if anything changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'root': os.path.abspath(self.root), 'files': self._entries}
+            try:
+                os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+                temp_path = self.manifest_path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(temp_path, self.manifest_path)
+                self._dirty = False
+            except (IOError, OSError) as e:
+                logger.debug(f"Could not persist manifest {self.manifest_path}: {e}")
+
+
+def manifest_path_for(local_path):
+    """Returns where the manifest for the script installed at local_path is stored."""
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(local_path)).encode('utf-8')).hexdigest()
+    return os.path.join(config_manager.MANIFESTS_DIR, f"{key}.json")
+
+def load_manifest(local_path):
+    """Returns the FileManifest for the script installed at local_path (empty if none was saved yet)."""
+    return FileManifest(local_path, manifest_path_for(local_path))
+
+def update_manifest(local_path, rehash=False):
+    """Refreshes and saves the manifest for local_path after an add, update or restore.
+
+    Args:
+        rehash (bool): Drop all cached hashes first. Used after a restore, whose
+            copies keep the archived mtimes and could otherwise match stale entries.
+    """
+    if not os.path.isdir(local_path):
+        return
+    manifest = load_manifest(local_path)
+    if rehash:
+        manifest.clear()
+    manifest.refresh()
+    manifest.save()
@@ -4,20 +4,51 @@ import os
 import shutil
 import json
 from zipfile import ZipFile
-from io import BytesIO
 import traceback
 from logger_setup import get_logger
 import config_manager
+import http_client
+import repo_cache
+import file_manifest
+import version_store
+import hashing
+import rate_limiter
 import hashlib
 import tempfile
+import tarfile
+import time
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from urllib.parse import quote
 from packaging.version import parse as parse_version
 
 logger = get_logger(__name__)
 
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+# Attempts per resumable download before giving up; each retry resumes where the last stopped.
+DOWNLOAD_ATTEMPTS = 5
+# (connect, read) timeout for streamed downloads, so a stalled transfer errors out and resumes.
+DOWNLOAD_TIMEOUT = (15, 60)
+# Repos resolved per GraphQL request; keeps each query well under GitHub's node limits.
+GRAPHQL_BATCH_SIZE = 50
+# Above this many changed files a differential update downloads the archive instead of single files.
+DIFF_MAX_BLOBS = 50
+# The compare API lists at most this many files; a comparison that hits it may be incomplete.
+COMPARE_MAX_FILES = 300
+# Leftover install dirs next to scripts: crashed staging dirs and replaced trees not yet deleted.
+_STALE_INSTALL_DIR_RE = re.compile(r'^\.(staging-.+|.+\.old-[0-9a-f]{8})$')
+# Anything modified after this may belong to this process; the slack covers coarse filesystem clocks.
+_SWEEP_CUTOFF = time.time() - 2
+# Replaced trees this process is still archiving or deleting; the startup sweep leaves them alone.
+_live_old_trees = set()
+
 # Repos that contain multiple independent script folders at their root.
 # On download, every root subdir (except "Older Versions") is renamed to prefix+name.
 # Rename is idempotent: folders already starting with the prefix are skipped.
-# These repos always use overwrite updates — differential can't reconcile renamed subdirs.
+# Differential and incremental updates apply the same mapping (see _installed_rel_path).
+# Folders in the shared parent are never deleted: it also holds user-created ones.
 _MULTI_FOLDER_REPOS = {
     "zewx1776/war-pig-zewx": "WarPig_",
     "oldonsteroid/d4qqt": "D4QQT_",
@@ -36,12 +67,91 @@ def is_multi_folder_repo(repo_url):
 def get_multi_folder_prefix(repo_url):
     return _get_multi_folder_prefix(repo_url)
 
-def _extract_multi_folder_repo(zf, search_prefix_in_zip, local_save_path, prefix):
+def _download_to_spool(response, chunk_size, spool_threshold):
+    """Streams a response body into a SpooledTemporaryFile and rewinds it.
+
+    Bodies up to spool_threshold bytes stay in memory; anything larger rolls
+    over to a temp file on disk, so peak memory is bounded by the threshold
+    regardless of archive size. The caller closes the returned file.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                spool.write(chunk)
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+def _copy_zip_member(zf, item_name, local_file, chunk_size=64 * 1024):
+    """Writes one zip member to local_file in fixed-size chunks."""
+    with zf.open(item_name) as src, open(local_file, 'wb') as dst:
+        shutil.copyfileobj(src, dst, chunk_size)
+
+def _subfolder_unchanged(target_path, expected):
+    """True if target_path holds exactly the files in expected ({rel_within: (size, crc32)}),
+    leaving out its "Older Versions"."""
+    if not os.path.isdir(target_path):
+        return False
+    local_files = set()
+    for dirpath, dirnames, filenames in os.walk(target_path):
+        if dirpath == target_path and "Older Versions" in dirnames:
+            dirnames.remove("Older Versions")
+        for filename in filenames:
+            local_files.add(os.path.relpath(os.path.join(dirpath, filename), target_path).replace(os.sep, '/'))
+    if local_files != set(expected):
+        return False
+    manifest = file_manifest.load_manifest(target_path)
+    local_crcs = manifest.get_hashes(expected, 'crc32', {rel_within: size for rel_within, (size, _) in expected.items()})
+    manifest.save()
+    return all(local_crcs.get(rel_within) == crc for rel_within, (_, crc) in expected.items())
+
+def _install_staged_subfolder(staging_dir, target_path, expected):
+    """Swaps a fully staged subfolder in as target_path and records its CRC32s in the manifest."""
+    _swap_in_staged_tree(staging_dir, target_path)
+    manifest = file_manifest.load_manifest(target_path)
+    manifest.clear()
+    for rel_within, (_, crc) in expected.items():
+        manifest.record(rel_within, 'crc32', crc)
+    manifest.save()
+
+def _multi_folder_file_unchanged(local_file, size, crc):
+    return (os.path.isfile(local_file) and os.path.getsize(local_file) == size
+            and hashing.hash_file(local_file, 'crc32') == crc)
+
+def _multi_folder_skips_file(filename):
+    """Top-level files of a multi-folder repo that are not installed."""
+    return filename.lower().startswith('readme') or filename in ('.gitignore', '.gitattributes')
+
+def _zip_expected(zf, files):
+    return {rel_within: (zf.getinfo(item_name).file_size, f"{zf.getinfo(item_name).CRC:08x}")
+            for item_name, rel_within in files}
+
+def _install_zip_subfolder(zf, files, target_path, chunk_size):
+    """Streams one subfolder's members into a staging dir next to target_path and swaps it in."""
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=os.path.dirname(os.path.abspath(target_path)))
+    try:
+        for item_name, rel_within in files:
+            local_file = os.path.join(staging_dir, rel_within.replace('/', os.sep))
+            os.makedirs(os.path.dirname(local_file), exist_ok=True)
+            _copy_zip_member(zf, item_name, local_file, chunk_size)
+        _install_staged_subfolder(staging_dir, target_path, _zip_expected(zf, files))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def _extract_multi_folder_repo(zf, search_prefix_in_zip, local_save_path, prefix, chunk_size=64 * 1024):
     """Extract a multi-folder repo's subdirs individually into local_save_path.
 
     Each top-level subdir in the zip is renamed with `prefix` and extracted to
-    local_save_path/<prefix>subdir_name/. Existing target dirs are wiped first.
-    Top-level files land in local_save_path directly. Never wipes local_save_path itself.
+    local_save_path/<prefix>subdir_name/. Subdirs whose files already match the
+    archive (same paths, sizes and CRC32s) are left untouched; changed ones are
+    streamed into a staging dir and swapped in, several at a time. Top-level
+    files land in local_save_path directly. Never wipes local_save_path itself.
+
+    Returns:
+        int: Number of files the installed subdirs and top-level files hold.
     """
     os.makedirs(local_save_path, exist_ok=True)
     extracted_count = 0
@@ -62,45 +172,94 @@ def _extract_multi_folder_repo(zf, search_prefix_in_zip, local_save_path, prefix
             dir_name = parts[0]
             top_level_dirs.setdefault(dir_name, []).append((item_name, '/'.join(parts[1:])))
 
-    for dir_name, files in top_level_dirs.items():
+    def install(dir_name, files):
         target_name = dir_name if dir_name.lower().startswith(prefix.lower()) else prefix + dir_name
         target_path = os.path.join(local_save_path, target_name)
-        if os.path.exists(target_path):
-            shutil.rmtree(target_path)
-        os.makedirs(target_path)
-        for item_name, rel_within in files:
-            local_file = os.path.join(target_path, rel_within.replace('/', os.sep))
-            parent = os.path.dirname(local_file)
-            if parent and not os.path.exists(parent):
-                os.makedirs(parent)
-            with open(local_file, 'wb') as f:
-                f.write(zf.read(item_name))
-            extracted_count += 1
+        if _subfolder_unchanged(target_path, _zip_expected(zf, files)):
+            logger.debug(f"Multi-folder unchanged: '{target_name}'")
+            return False
+        _install_zip_subfolder(zf, files, target_path, chunk_size)
         logger.debug(f"Multi-folder extracted: '{dir_name}' -> '{target_name}'")
+        return True
+
+    if top_level_dirs:
+        # ZipFile serialises raw reads of the shared archive; decompression and writes run in parallel
+        with ThreadPoolExecutor() as executor:
+            futures = {executor.submit(install, dir_name, files): dir_name for dir_name, files in top_level_dirs.items()}
+            rewritten = sum(1 for future in as_completed(futures) if future.result())
+        logger.info(f"Multi-folder: rewrote {rewritten} of {len(top_level_dirs)} subfolders.")
+        extracted_count += sum(len(files) for files in top_level_dirs.values())
 
-    _MF_SKIP_FILES = {'.gitignore', '.gitattributes'}
     for item_name, filename in top_level_files:
-        if filename.lower().startswith('readme') or filename in _MF_SKIP_FILES:
+        if _multi_folder_skips_file(filename):
             continue
-        with open(os.path.join(local_save_path, filename), 'wb') as f:
-            f.write(zf.read(item_name))
+        local_file = os.path.join(local_save_path, filename)
+        info = zf.getinfo(item_name)
+        if not _multi_folder_file_unchanged(local_file, info.file_size, f"{info.CRC:08x}"):
+            # Never write into the installed file, which may share its inode with an archived blob
+            _copy_zip_member(zf, item_name, local_file + '.part', chunk_size)
+            os.replace(local_file + '.part', local_file)
         extracted_count += 1
 
     return extracted_count
 
+def _install_staged_multi_folder_repo(staging_dir, local_save_path, prefix):
+    """Installs a multi-folder repo extracted to staging_dir into local_save_path.
+
+    The staged counterpart of _extract_multi_folder_repo, with the same rules:
+    subdirs are renamed with `prefix`, ones whose files already match (same
+    paths, sizes and CRC32s) are left untouched and changed ones are swapped
+    in whole. Never wipes local_save_path itself.
+
+    Returns:
+        int: Number of files the installed subdirs and top-level files hold.
+    """
+    os.makedirs(local_save_path, exist_ok=True)
+    extracted_count = 0
+    rewritten = 0
+    subdirs = 0
+    for item in sorted(os.listdir(staging_dir)):
+        src_path = os.path.join(staging_dir, item)
+        if os.path.isdir(src_path):
+            expected = {}
+            for dirpath, _, filenames in os.walk(src_path):
+                for filename in filenames:
+                    file_path = os.path.join(dirpath, filename)
+                    rel_within = os.path.relpath(file_path, src_path).replace(os.sep, '/')
+                    expected[rel_within] = (os.path.getsize(file_path), hashing.hash_file(file_path, 'crc32'))
+            target_name = item if item.lower().startswith(prefix.lower()) else prefix + item
+            target_path = os.path.join(local_save_path, target_name)
+            subdirs += 1
+            extracted_count += len(expected)
+            if _subfolder_unchanged(target_path, expected):
+                logger.debug(f"Multi-folder unchanged: '{target_name}'")
+                continue
+            _install_staged_subfolder(src_path, target_path, expected)
+            rewritten += 1
+            logger.debug(f"Multi-folder extracted: '{item}' -> '{target_name}'")
+        elif not _multi_folder_skips_file(item):
+            local_file = os.path.join(local_save_path, item)
+            if not _multi_folder_file_unchanged(local_file, os.path.getsize(src_path), hashing.hash_file(src_path, 'crc32')):
+                os.replace(src_path, local_file)
+            extracted_count += 1
+    if subdirs:
+        logger.info(f"Multi-folder: rewrote {rewritten} of {subdirs} subfolders.")
+    return extracted_count
+
 def check_for_app_update(current_version):
     """Checks for a new application release on GitHub.
-    Returns (latest_version, download_url, release_notes, status) where status is one of:
-    'update_available', 'up_to_date', 'prerelease', 'no_asset', 'error'."""
+    Returns (latest_version, download_url, download_size, release_notes, status) where status is one of:
+    'update_available', 'up_to_date', 'prerelease', 'no_asset', 'error'. download_size is the
+    asset's size as listed on the release, for download_app_update to check against."""
     try:
         repo_url = "https://api.github.com/repos/RadDude42/Updater/releases/latest"
-        response = requests.get(repo_url, headers=get_github_headers())
+        response = http_client.get(repo_url, use_cache=True)
         response.raise_for_status()
         release_data = response.json()
 
         if release_data.get("prerelease"):
             logger.info("Latest release is a pre-release, skipping.")
-            return None, None, None, "prerelease"
+            return None, None, None, None, "prerelease"
 
         tag = release_data.get("tag_name", "0.0.0")
         m = re.search(r'(\d+(?:\.\d+)*)', tag)
@@ -113,62 +272,151 @@ def check_for_app_update(current_version):
             release_notes = release_data.get("body", "No release notes available.")
             for asset in release_data.get("assets", []):
                 if asset['name'].lower() == 'scriptupdaterapp.exe':
-                    return latest_v, asset['browser_download_url'], release_notes, "update_available"
+                    return latest_v, asset['browser_download_url'], asset.get('size'), release_notes, "update_available"
             logger.warning("New release found, but 'ScriptUpdaterApp.exe' asset is missing.")
-            return None, None, None, "no_asset"
+            return None, None, None, None, "no_asset"
 
         logger.info(f"App is up to date (current: {current_v}, latest: {latest_v})")
-        return None, None, None, "up_to_date"
+        return None, None, None, None, "up_to_date"
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to check for app update: {e}")
     except Exception as e:
         logger.error(f"An error occurred during app update check: {e}")
 
-    return None, None, None, "error"
+    return None, None, None, None, "error"
 
 
-def download_app_update(url, dest_path, progress_callback):
-    """Streams the new executable to dest_path, calling progress_callback(bytes_done, total_bytes)."""
-    response = requests.get(url, stream=True, headers=get_github_headers())
-    response.raise_for_status()
-    total = int(response.headers.get("Content-Length", 0))
-    downloaded = 0
-    with open(dest_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-                downloaded += len(chunk)
-                progress_callback(downloaded, total)
+def _download_resumable(url, dest_path, expected_size=None, progress_callback=None, github_headers=True, chunk_size=64 * 1024):
+    """Downloads url to dest_path, resuming interrupted transfers with HTTP Range requests.
+
+    Bytes land in dest_path + '.part'; a sidecar dest_path + '.part.json' records
+    the URL, the expected size and the server's ETag. A later call (or a retry
+    after a dropped connection) sends Range/If-Range and appends to the partial
+    file; if the resource changed the server answers 200 and the download
+    restarts from zero. The finished file must match expected_size (or the size
+    the server announced) before it is moved to dest_path.
+
+    Raises:
+        IOError: If the finished size doesn't match.
+        requests.exceptions.RequestException: If all attempts fail.
+    """
+    part_path = dest_path + '.part'
+    meta_path = part_path + '.json'
+    meta = {}
+    if os.path.exists(part_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            meta = {}
+        if meta.get('url') != url or (expected_size and meta.get('expected_size') not in (None, expected_size)):
+            meta = {}
+    if not meta and os.path.exists(part_path):
+        os.remove(part_path)
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+
+    total = expected_size or meta.get('expected_size')
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if total and offset == total:
+            break
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if meta.get('etag'):
+                headers['If-Range'] = meta['etag']
+        try:
+            with http_client.get(url, stream=True, github_headers=github_headers, headers=headers,
+                                 timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 416 and offset:
+                    # Nothing left to send for our offset: either done, or the part file is bad.
+                    if total and offset == total:
+                        break
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+                if response.status_code == 206:
+                    logger.info(f"Resuming download of {os.path.basename(dest_path)} at byte {offset}")
+                    mode = 'ab'
+                    content_range = response.headers.get('Content-Range', '')
+                    if not total and '/' in content_range and not content_range.endswith('/*'):
+                        total = int(content_range.rsplit('/', 1)[1])
+                else:
+                    offset = 0
+                    mode = 'wb'
+                    if not total and response.headers.get('Content-Length'):
+                        total = int(response.headers['Content-Length'])
+
+                meta = {'url': url, 'expected_size': total, 'etag': response.headers.get('ETag')}
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f)
+
+                downloaded = offset
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                            if progress_callback:
+                                progress_callback(downloaded, total or 0)
+            if not total:
+                break  # size unknown; a clean end of stream is all we can check
+            if downloaded >= total:
+                break
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout) as e:
+            if attempt == DOWNLOAD_ATTEMPTS:
+                raise
+            logger.warning(f"Download of {os.path.basename(dest_path)} interrupted ({e}); resuming (attempt {attempt + 1}/{DOWNLOAD_ATTEMPTS})")
+            time.sleep(attempt)
+
+    final_size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if total and final_size != total:
+        for stale_path in (part_path, meta_path):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        raise IOError(f"Downloaded size {final_size} of {os.path.basename(dest_path)} does not match expected {total} bytes.")
+    os.replace(part_path, dest_path)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    return dest_path
+
+def _asset_download_path(asset):
+    """Stable cache location for a release asset, so a partial download survives restarts."""
+    asset_key = asset.get('id') or hashlib.sha1(asset['browser_download_url'].encode('utf-8')).hexdigest()[:16]
+    return os.path.join(config_manager.DOWNLOADS_DIR, f"{asset_key}-{asset['name']}")
+
+def download_app_update(url, dest_path, progress_callback, expected_size=None):
+    """Downloads the new executable to dest_path, calling progress_callback(bytes_done, total_bytes).
+    An interrupted download is resumed from where it stopped, and the finished file is size-checked."""
+    _download_resumable(url, dest_path, expected_size, progress_callback)
 
 def calculate_sha256(file_path):
     """Calculate SHA256 hash of a file."""
     try:
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            # Read file in chunks to handle large files efficiently
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(chunk)
-        return sha256_hash.hexdigest()
+        return hashing.hash_file(file_path, 'sha256')
     except Exception as e:
         logger.error(f"Error calculating SHA256 for {file_path}: {e}")
         return None
 
+def calculate_git_blob_sha(file_path):
+    """Calculate the git blob SHA-1 of a file, i.e. the id git gives its content in a tree."""
+    try:
+        return hashing.hash_file(file_path, 'git')
+    except Exception as e:
+        logger.error(f"Error calculating git blob SHA for {file_path}: {e}")
+        return None
+
 def get_github_headers():
-    """Get headers for GitHub API requests with optional authentication."""
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
-    token = config_manager.get_github_token()
-    if token:
-        headers['Authorization'] = f'token {token}'
-        logger.debug("Using GitHub token authentication")
-    else:
-        logger.debug("Using unauthenticated GitHub API requests")
-    
-    return headers
+    """Get headers for GitHub API requests with optional authentication.
+    Served from the shared HTTP client's cache, so settings are only read once."""
+    return http_client.get_client().get_headers()
+
+def reset_github_auth():
+    """Drops the cached auth headers and rate-limit budgets so the next request picks up a changed token."""
+    http_client.get_client().invalidate_headers()
+    rate_limiter.get_scheduler().reset()
 
 def get_repo_api_url(repo_url):
     """Constructs the base API URL from a GitHub repository URL."""
@@ -179,12 +427,78 @@ def get_repo_api_url(repo_url):
     repo_name = parts[4].split('/tree/')[0]
     return f"https://api.github.com/repos/{user}/{repo_name}"
 
+def _split_repo_url(repo_url):
+    """Returns (user, repo_name) for a GitHub repository URL."""
+    parts = repo_url.strip('/').split('/')
+    if len(parts) < 5 or parts[2] != 'github.com':
+        raise ValueError("Invalid GitHub repository URL format.")
+    return parts[3], parts[4].split('/tree/')[0]
+
+def get_repo_info(user, repo_name, refresh=False):
+    """Returns cached metadata for a repository, fetching it from the API on a miss.
+
+    Args:
+        user (str): Repository owner.
+        repo_name (str): Repository name.
+        refresh (bool): Ignore the cache and re-fetch.
+
+    Returns:
+        dict or None: {'default_branch', 'id', 'pushed_at', 'fetched_at'}, or None if the lookup failed.
+    """
+    cache = repo_cache.get_repo_cache()
+    if not refresh:
+        cached = cache.get(user, repo_name)
+        if cached:
+            return cached
+    try:
+        response = http_client.get(f"https://api.github.com/repos/{user}/{repo_name}", use_cache=True)
+        response.raise_for_status()
+        repo_info = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning(f"Could not fetch repository info for {user}/{repo_name}: {e}")
+        return None
+    return cache.put(user, repo_name, repo_info.get('default_branch'), repo_info.get('id'), repo_info.get('pushed_at'))
+
+def get_default_branch(user, repo_name, fallback='main', refresh=False):
+    """Returns a repository's default branch (cached), or fallback if it can't be resolved."""
+    repo_info = get_repo_info(user, repo_name, refresh)
+    if repo_info and repo_info.get('default_branch'):
+        return repo_info['default_branch']
+    return fallback
+
+def _download_release_assets(assets):
+    """Downloads release assets concurrently, yielding (asset, path) as each one finishes.
+
+    Assets are fetched resumably into the download cache by a pool of
+    'asset_workers' threads using the configured chunk size. Work done by the
+    caller between yields (e.g. extracting a finished archive) overlaps with
+    the downloads still in flight.
+
+    Raises:
+        Exception: The first download error; pending downloads are cancelled.
+    """
+    download = config_manager.get_download_settings()
+
+    def fetch(asset):
+        logger.info(f"Downloading release asset: {asset['name']}")
+        return _download_resumable(asset['browser_download_url'], _asset_download_path(asset), asset.get('size'),
+                                   github_headers=False, chunk_size=download['chunk_size'])
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(download['asset_workers'], len(assets))))
+    try:
+        futures = {executor.submit(fetch, asset): asset for asset in assets}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
 def download_release_exe(repo_url, local_save_path):
-    """Downloads .exe files from the latest release of a GitHub repository."""
+    """Downloads .exe files from the latest release of a GitHub repository.
+    Assets download in parallel."""
     try:
         api_url = get_repo_api_url(repo_url)
         releases_url = f"{api_url}/releases/latest"
-        response = requests.get(releases_url, headers=get_github_headers())
+        response = http_client.get(releases_url, use_cache=True)
         response.raise_for_status()
         release_data = response.json()
 
@@ -193,20 +507,16 @@ def download_release_exe(repo_url, local_save_path):
         if not exe_assets:
             return False, "No .exe files found in the latest release.", None
 
-        if os.path.exists(local_save_path):
-            shutil.rmtree(local_save_path)
-        os.makedirs(local_save_path)
+        # Download (resumably) before touching the install, so a failed download leaves it intact
+        downloaded_paths = {asset['name']: path for asset, path in _download_release_assets(exe_assets)}
+
+        # Clear the install but leave archived versions where they are
+        _remove_all_except_older_versions(local_save_path)
+        os.makedirs(local_save_path, exist_ok=True)
 
         for asset in exe_assets:
-            asset_url = asset['browser_download_url']
-            local_filename = os.path.join(local_save_path, asset['name'])
-            logger.info(f"Downloading release asset: {asset['name']}")
-            with requests.get(asset_url, stream=True) as r:
-                r.raise_for_status()
-                with open(local_filename, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-        
+            shutil.move(downloaded_paths[asset['name']], os.path.join(local_save_path, asset['name']))
+
         return True, f"Successfully downloaded {len(exe_assets)} .exe file(s) from the latest release.", local_save_path
 
     except requests.exceptions.HTTPError as e:
@@ -217,11 +527,13 @@ def download_release_exe(repo_url, local_save_path):
         return False, f"An error occurred during release download: {e}", None
 
 def download_release_zip(repo_url, local_save_path):
-    """Downloads and extracts .zip files from the latest release of a GitHub repository."""
+    """Downloads and extracts .zip files from the latest release of a GitHub repository.
+    Assets download in parallel and each finished zip is extracted while the rest are still
+    downloading."""
     try:
         api_url = get_repo_api_url(repo_url)
         releases_url = f"{api_url}/releases/latest"
-        response = requests.get(releases_url, headers=get_github_headers())
+        response = http_client.get(releases_url, use_cache=True)
         response.raise_for_status()
         release_data = response.json()
 
@@ -230,53 +542,39 @@ def download_release_zip(repo_url, local_save_path):
         if not zip_assets:
             return False, "No .zip files found in the latest release.", None
 
-        if os.path.exists(local_save_path):
-            shutil.rmtree(local_save_path)
-        os.makedirs(local_save_path)
-
-        extracted_count = 0
-        for asset in zip_assets:
-            asset_url = asset['browser_download_url']
-            logger.info(f"Downloading and extracting release asset: {asset['name']}")
-
-            # Download to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
-                temp_zip_path = temp_file.name
-                with requests.get(asset_url, stream=True) as r:
-                    r.raise_for_status()
-                    for chunk in r.iter_content(chunk_size=8192):
-                        temp_file.write(chunk)
-
-            # Extract the ZIP file
-            try:
-                with ZipFile(temp_zip_path, 'r') as zip_ref:
-                    # Extract to a temporary directory first to avoid conflicts
-                    with tempfile.TemporaryDirectory() as temp_extract_dir:
-                        zip_ref.extractall(temp_extract_dir)
-
-                        # Move extracted files to final location
-                        for item in os.listdir(temp_extract_dir):
-                            src_path = os.path.join(temp_extract_dir, item)
-                            dest_path = os.path.join(local_save_path, item)
-
-                            if os.path.isdir(src_path):
-                                if os.path.exists(dest_path):
-                                    shutil.rmtree(dest_path)
-                                shutil.move(src_path, dest_path)
-                            else:
-                                shutil.move(src_path, dest_path)
-
-                    extracted_count += 1
+        # Each zip extracts into its own staging subdir as soon as it arrives; the install is
+        # only touched once every asset is in, so a failed download leaves it intact.
+        parent_dir = os.path.dirname(os.path.abspath(local_save_path))
+        os.makedirs(parent_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=parent_dir)
+        try:
+            for asset, temp_zip_path in _download_release_assets(zip_assets):
+                logger.info(f"Extracting release asset: {asset['name']}")
+                try:
+                    with ZipFile(temp_zip_path, 'r') as zip_ref:
+                        zip_ref.extractall(os.path.join(staging_dir, str(zip_assets.index(asset))))
+                finally:
+                    # Clean up temp ZIP file
+                    if os.path.exists(temp_zip_path):
+                        os.unlink(temp_zip_path)
+
+            # Clear the install but leave archived versions where they are
+            _remove_all_except_older_versions(local_save_path)
+            os.makedirs(local_save_path, exist_ok=True)
 
-            finally:
-                # Clean up temp ZIP file
-                if os.path.exists(temp_zip_path):
-                    os.unlink(temp_zip_path)
+            # Move extracted files to final location, in release order so later assets win on conflicts
+            for index in range(len(zip_assets)):
+                extract_dir = os.path.join(staging_dir, str(index))
+                for item in os.listdir(extract_dir):
+                    src_path = os.path.join(extract_dir, item)
+                    dest_path = os.path.join(local_save_path, item)
+                    if os.path.isdir(dest_path):
+                        shutil.rmtree(dest_path)
+                    shutil.move(src_path, dest_path)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
 
-        if extracted_count > 0:
-            return True, f"Successfully downloaded and extracted {extracted_count} .zip file(s) from the latest release.", local_save_path
-        else:
-            return False, "Downloaded .zip files but failed to extract any of them.", None
+        return True, f"Successfully downloaded and extracted {len(zip_assets)} .zip file(s) from the latest release.", local_save_path
 
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 404:
@@ -285,17 +583,33 @@ def download_release_zip(repo_url, local_save_path):
     except Exception as e:
         return False, f"An error occurred during release ZIP download: {e}", None
 
+def _get_default_branch_tree(user, repo_name):
+    """Fetches the recursive git tree of a repository's default branch.
+
+    A cached default branch that 404s was probably renamed; it is resolved
+    again and the tree fetched once more.
+
+    Returns:
+        tuple: (default_branch, response)
+    """
+    default_branch = get_default_branch(user, repo_name)
+    trees_url = f"https://api.github.com/repos/{user}/{repo_name}/git/trees/{default_branch}?recursive=1"
+    logger.debug(f"Getting repo tree from: {trees_url}")
+    response = http_client.get(trees_url)
+    if response.status_code == 404:
+        resolved_branch = get_default_branch(user, repo_name, default_branch, refresh=True)
+        if resolved_branch != default_branch:
+            logger.info(f"Default branch of {user}/{repo_name} is now '{resolved_branch}'; fetching its tree.")
+            default_branch = resolved_branch
+            response = http_client.get(f"https://api.github.com/repos/{user}/{repo_name}/git/trees/{default_branch}?recursive=1")
+    response.raise_for_status()
+    return default_branch, response
+
 def download_repo_exes(repo_url, local_save_path):
     """Downloads all .exe files found in a GitHub repository's default branch."""
     try:
         api_url = get_repo_api_url(repo_url)
-        repo_info = requests.get(api_url, headers=get_github_headers()).json()
-        default_branch = repo_info.get('default_branch', 'main')
-        
-        trees_url = f"{api_url}/git/trees/{default_branch}?recursive=1"
-        logger.debug(f"Getting repo tree from: {trees_url}")
-        response = requests.get(trees_url, headers=get_github_headers())
-        response.raise_for_status()
+        default_branch, response = _get_default_branch_tree(*_split_repo_url(repo_url))
         tree_data = response.json()
 
         # Extensive logging to debug file finding
@@ -315,9 +629,9 @@ def download_repo_exes(repo_url, local_save_path):
         if not exe_files:
             return False, "No .exe files found in the repository based on tree scan.", None
 
-        if os.path.exists(local_save_path):
-            shutil.rmtree(local_save_path)
-        os.makedirs(local_save_path)
+        # Clear the install but leave archived versions where they are
+        _remove_all_except_older_versions(local_save_path)
+        os.makedirs(local_save_path, exist_ok=True)
 
         # Using contents API to get download URLs is more reliable
         for exe_file in exe_files:
@@ -325,7 +639,7 @@ def download_repo_exes(repo_url, local_save_path):
             contents_url = f"{api_url}/contents/{file_path}?ref={default_branch}"
             logger.debug(f"Getting contents for {file_path} from {contents_url}")
             
-            contents_response = requests.get(contents_url, headers=get_github_headers())
+            contents_response = http_client.get(contents_url)
             if contents_response.status_code != 200:
                 logger.warning(f"Failed to get contents for {file_path}. Status: {contents_response.status_code}. Skipping.")
                 continue
@@ -338,7 +652,7 @@ def download_repo_exes(repo_url, local_save_path):
 
             local_filename = os.path.join(local_save_path, os.path.basename(file_path))
             logger.info(f"Downloading repo file: {file_path}")
-            with requests.get(download_url, stream=True) as r:
+            with http_client.get(download_url, stream=True, github_headers=False) as r:
                 r.raise_for_status()
                 with open(local_filename, 'wb') as f:
                     for chunk in r.iter_content(chunk_size=8192):
@@ -359,13 +673,7 @@ def download_repo_zips(repo_url, local_save_path):
     """Downloads and extracts all .zip files found in a GitHub repository's default branch."""
     try:
         api_url = get_repo_api_url(repo_url)
-        repo_info = requests.get(api_url, headers=get_github_headers()).json()
-        default_branch = repo_info.get('default_branch', 'main')
-
-        trees_url = f"{api_url}/git/trees/{default_branch}?recursive=1"
-        logger.debug(f"Getting repo tree from: {trees_url}")
-        response = requests.get(trees_url, headers=get_github_headers())
-        response.raise_for_status()
+        default_branch, response = _get_default_branch_tree(*_split_repo_url(repo_url))
         tree_data = response.json()
 
         # Extensive logging to debug file finding
@@ -385,9 +693,9 @@ def download_repo_zips(repo_url, local_save_path):
         if not zip_files:
             return False, "No .zip files found in the repository based on tree scan.", None
 
-        if os.path.exists(local_save_path):
-            shutil.rmtree(local_save_path)
-        os.makedirs(local_save_path)
+        # Clear the install but leave archived versions where they are
+        _remove_all_except_older_versions(local_save_path)
+        os.makedirs(local_save_path, exist_ok=True)
 
         extracted_count = 0
         # Using contents API to get download URLs is more reliable
@@ -396,7 +704,7 @@ def download_repo_zips(repo_url, local_save_path):
             contents_url = f"{api_url}/contents/{file_path}?ref={default_branch}"
             logger.debug(f"Getting contents for {file_path} from {contents_url}")
 
-            contents_response = requests.get(contents_url, headers=get_github_headers())
+            contents_response = http_client.get(contents_url)
             if contents_response.status_code != 200:
                 logger.warning(f"Failed to get contents for {file_path}. Status: {contents_response.status_code}. Skipping.")
                 continue
@@ -412,7 +720,7 @@ def download_repo_zips(repo_url, local_save_path):
             # Download to temporary file
             with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
                 temp_zip_path = temp_file.name
-                with requests.get(download_url, stream=True) as r:
+                with http_client.get(download_url, stream=True, github_headers=False) as r:
                     r.raise_for_status()
                     for chunk in r.iter_content(chunk_size=8192):
                         temp_file.write(chunk)
@@ -467,8 +775,9 @@ def determine_effective_branch(repo_url, branch_hint=None):
     logger.debug(f"Effective branch determined: {effective_branch}")
     return effective_branch
 
-def download_from_github(repo_url, folder_path, local_save_path, category, branch=None):
-    """Main function to download from GitHub, handling different categories."""
+def download_from_github(repo_url, folder_path, local_save_path, category, branch=None, archive_sha=None):
+    """Main function to download from GitHub, handling different categories.
+    archive_sha is passed on to download_folder_from_github for script folders."""
     if category == "Programs":
         logger.info("Program download detected. Checking for releases first.")
         success, message, path = download_release_exe(repo_url, local_save_path)
@@ -493,142 +802,317 @@ def download_from_github(repo_url, folder_path, local_save_path, category, branc
             return False, "Could not find any .exe or .zip files in releases or repository.", None
     else:
         # Fallback to original folder download logic for other categories
-        return download_folder_from_github(repo_url, folder_path, local_save_path, branch)
+        return download_folder_from_github(repo_url, folder_path, local_save_path, branch, archive_sha=archive_sha)
+
+def _remove_all_except_older_versions(local_save_path):
+    """Deletes everything in local_save_path except the "Older Versions" folder."""
+    if not os.path.isdir(local_save_path):
+        return
+    for item in os.listdir(local_save_path):
+        if item == "Older Versions":
+            continue
+        item_path = os.path.join(local_save_path, item)
+        if os.path.isdir(item_path) and not os.path.islink(item_path):
+            shutil.rmtree(item_path)
+        else:
+            os.remove(item_path)
+
+def _lift_main_lua_in_place(directory):
+    """Lua restructure: if main.lua sits in the only subfolder of directory, moves that
+    subfolder's contents up into directory (renames only)."""
+    if os.path.exists(os.path.join(directory, "main.lua")):
+        return
+    subdirs = [item for item in os.listdir(directory) if os.path.isdir(os.path.join(directory, item))]
+    if len(subdirs) == 1 and os.path.exists(os.path.join(directory, subdirs[0], "main.lua")):
+        logger.debug(f"Restructure: Found main.lua in single subdirectory '{subdirs[0]}'. Restructuring.")
+        lifted_dir = directory + '.lift'
+        os.replace(os.path.join(directory, subdirs[0]), lifted_dir)
+        for item in os.listdir(lifted_dir):
+            # A lifted "Older Versions" is not installed, as in _installed_layout
+            if item != "Older Versions":
+                os.replace(os.path.join(lifted_dir, item), os.path.join(directory, item))
+        shutil.rmtree(lifted_dir)
 
-def download_folder_from_github(repo_url, folder_path, local_save_path, branch=None):
-    """Downloads a specific folder from a GitHub repository.
+def _swap_in_staged_tree(staging_dir, local_save_path, archive_sha=None):
+    """Installs staging_dir as local_save_path with a rename swap.
 
-    Args:
-        repo_url (str): The URL of the GitHub repository (e.g., https://github.com/user/repo).
-        folder_path (str): The path to the folder within the repository (e.g., 'src/my_folder' or '' for root).
-        local_save_path (str): The local directory where the folder contents should be saved.
-        branch (str): The branch to download from (defaults to 'Main').
+    "Older Versions" is carried over into the staged tree by rename, the current
+    tree is renamed aside and the staged one renamed into place, so the script is
+    only missing for the time between two renames. If archive_sha is given and
+    not archived yet, the previous tree is then archived as that commit by moving
+    its new blobs into the version store (no copying); the rest of it is deleted
+    on a background thread.
 
-    Returns:
-        tuple: (bool, str, str) indicating (success_status, message, final_script_path).
+    Raises:
+        OSError: If the swap fails; the previous tree is put back first.
     """
-    try:
-        branch_explicitly_set = "/tree/" in repo_url or bool(branch)
-        effective_branch = determine_effective_branch(repo_url, branch)
+    older_versions_path = os.path.join(local_save_path, "Older Versions")
+    staged_older_versions = os.path.join(staging_dir, "Older Versions")
+    if not os.path.exists(local_save_path):
+        os.replace(staging_dir, local_save_path)
+        return
+
+    version_id = new_version_id(local_save_path, archive_sha, "from-github") if archive_sha else None
+    # Hashes of the current tree, taken from its manifest before it is renamed away
+    hashes = version_store.tree_hashes(local_save_path) if version_id else None
+
+    parent_dir, name = os.path.split(os.path.abspath(local_save_path))
+    old_tree = os.path.join(parent_dir, f".{name}.old-{uuid.uuid4().hex[:8]}")
+    # Held while "Older Versions" moves, so a background prune never has it renamed under it
+    store = version_store.VersionStore(local_save_path)
+    with store.locked():
+        moved_older_versions = False
+        if os.path.isdir(older_versions_path):
+            os.replace(older_versions_path, staged_older_versions)
+            moved_older_versions = True
+
+        _live_old_trees.add(old_tree)
+        try:
+            os.replace(local_save_path, old_tree)
+            try:
+                os.replace(staging_dir, local_save_path)
+            except OSError:
+                os.replace(old_tree, local_save_path)
+                raise
+        except OSError:
+            _live_old_trees.discard(old_tree)
+            if moved_older_versions:
+                os.replace(staged_older_versions, older_versions_path)
+            raise
+
+        if version_id:
+            try:
+                store.archive(old_tree, version_id, archive_sha, "from-github", hashes=hashes, consume=True)
+            except OSError as e:
+                logger.warning(f"Could not archive the replaced version as {version_id}: {e}")
+    threading.Thread(target=_remove_old_tree, args=(old_tree,), daemon=True).start()
+
+def _remove_old_tree(old_tree):
+    shutil.rmtree(old_tree, ignore_errors=True)
+    _live_old_trees.discard(old_tree)
 
-        api_url_base = repo_url.split('/tree/')[0] if "/tree/" in repo_url else repo_url
-        user, repo_name = api_url_base.strip('/').split('/')[-2:]
+def cleanup_stale_install_dirs(directories):
+    """Deletes install leftovers from earlier runs in the given directories.
 
-        if not branch_explicitly_set:
+    A replaced tree (".<name>.old-xxxxxxxx") is deleted on a daemon thread that
+    dies with the app, and a crash leaves its ".staging-*" dirs behind. Dirs
+    created by this process are skipped, so the sweep can run beside an update.
+
+    Returns:
+        int: Number of directories removed.
+    """
+    removed = 0
+    for directory in set(os.path.abspath(d) for d in directories if d):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            if not _STALE_INSTALL_DIR_RE.match(name) or path in _live_old_trees:
+                continue
             try:
-                repo_info = requests.get(
-                    f"https://api.github.com/repos/{user}/{repo_name}",
-                    headers=get_github_headers()
-                ).json()
-                effective_branch = repo_info.get('default_branch', effective_branch)
-                logger.debug(f"Resolved default branch from API: {effective_branch}")
-            except Exception as e:
-                logger.warning(f"Could not resolve default branch from API, using '{effective_branch}': {e}")
+                if not os.path.isdir(path) or os.path.islink(path) or os.path.getmtime(path) >= _SWEEP_CUTOFF:
+                    continue
+            except OSError:
+                continue
+            logger.info(f"Removing leftover install directory: {path}")
+            shutil.rmtree(path, ignore_errors=True)
+            removed += not os.path.exists(path)
+    return removed
+
+def _stream_tar_folder(response, folder_path, staging_dir, chunk_size):
+    """Decompresses a tarball response on the fly, writing only entries under folder_path.
 
-        archive_url = f"https://api.github.com/repos/{user}/{repo_name}/zipball/{effective_branch}"
+    Entries outside folder_path are skipped as they stream past, so download
+    and extraction overlap and nothing else touches the disk.
 
-        zip_response = requests.get(archive_url, headers=get_github_headers(), stream=True)
+    Returns:
+        tuple: (extracted_count, folder_seen)
+    """
+    response.raw.decode_content = True
+    normalized_folder = folder_path.strip('/').replace(os.sep, '/')
+    extracted_count = 0
+    folder_seen = False
+
+    with tarfile.open(fileobj=response.raw, mode='r|*') as tf:
+        for member in tf:
+            parts = member.name.split('/', 1)
+            relative = parts[1] if len(parts) > 1 else ''
+            if normalized_folder:
+                if relative != normalized_folder and not relative.startswith(normalized_folder + '/'):
+                    continue
+                relative = relative[len(normalized_folder):].lstrip('/')
+            folder_seen = True
+            if not relative or not member.isfile():
+                continue
+            if relative.startswith('/') or '..' in relative.split('/'):
+                logger.warning(f"Skipping unsafe tar entry: {member.name}")
+                continue
+
+            local_file = os.path.join(staging_dir, relative.replace('/', os.sep))
+            os.makedirs(os.path.dirname(local_file), exist_ok=True)
+            with tf.extractfile(member) as src, open(local_file, 'wb') as dst:
+                shutil.copyfileobj(src, dst, chunk_size)
+            extracted_count += 1
+
+    return extracted_count, folder_seen
+
+def _download_folder_via_tarball(user, repo_name, ref, folder_path, local_save_path, mf_prefix, archive_sha=None):
+    """Tarball engine for download_folder_from_github.
+
+    Streams the repository tarball, extracting only folder_path into a sibling
+    staging directory while it downloads, then moves the result into place
+    with renames. Same return contract as download_folder_from_github.
+    """
+    folder_label = folder_path if folder_path else 'root'
+    chunk_size = config_manager.get_download_settings()['chunk_size']
+    parent_dir = os.path.dirname(os.path.abspath(local_save_path))
+    os.makedirs(parent_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=parent_dir)
+    try:
+        tarball_url = f"https://api.github.com/repos/{user}/{repo_name}/tarball/{ref}"
+        with http_client.get(tarball_url, stream=True) as response:
+            response.raise_for_status()
+            extracted_count, folder_seen = _stream_tar_folder(response, folder_path, staging_dir, chunk_size)
+
+        if not folder_seen:
+            return False, f"Folder '{folder_label}' not found in the repository archive.", local_save_path
+
+        if mf_prefix is not None:
+            extracted_count = _install_staged_multi_folder_repo(staging_dir, local_save_path, mf_prefix)
+        else:
+            _lift_main_lua_in_place(staging_dir)
+            # Like _installed_layout, a repo's own "Older Versions" is dropped once the lift is applied
+            shutil.rmtree(os.path.join(staging_dir, "Older Versions"), ignore_errors=True)
+            extracted_count = sum(len(filenames) for _, _, filenames in os.walk(staging_dir))
+            _swap_in_staged_tree(staging_dir, local_save_path, archive_sha)
+
+        if extracted_count == 0:
+            return True, f"Folder '{folder_label}' downloaded successfully. It is empty or contains only subdirectories.", local_save_path
+        return True, f"Folder '{folder_label}' downloaded successfully. Extracted {extracted_count} files.", local_save_path
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def _download_folder_via_zipball(user, repo_name, ref, folder_path, local_save_path, mf_prefix, archive_sha=None):
+    """Zipball engine for download_folder_from_github.
+
+    Downloads the repository zipball (spooled to disk when large), then extracts
+    folder_path into a sibling staging directory and moves it into place with
+    renames. Same return contract as download_folder_from_github.
+    """
+    archive_url = f"https://api.github.com/repos/{user}/{repo_name}/zipball/{ref}"
+
+    download_settings = config_manager.get_download_settings()
+    chunk_size = download_settings['chunk_size']
+    with http_client.get(archive_url, stream=True) as zip_response:
         zip_response.raise_for_status()
+        zip_content = _download_to_spool(zip_response, chunk_size, download_settings['spool_threshold'])
 
-        zip_content = BytesIO(zip_response.content)
-        extracted_count = 0
-        final_actual_path = local_save_path
-        mf_prefix = _get_multi_folder_prefix(repo_url)
+    extracted_count = 0
+    final_actual_path = local_save_path
 
-        with ZipFile(zip_content) as zf:
-            if not zf.namelist():
-                return False, "Downloaded zip file is empty.", final_actual_path
+    with zip_content, ZipFile(zip_content) as zf:
+        if not zf.namelist():
+            return False, "Downloaded zip file is empty.", final_actual_path
 
-            repo_root_dir_in_zip = zf.namelist()[0].split('/')[0] + '/'
+        repo_root_dir_in_zip = zf.namelist()[0].split('/')[0] + '/'
 
-            normalized_folder_path_for_zip = folder_path.strip('/').replace(os.sep, '/')
-            if normalized_folder_path_for_zip:
-                search_prefix_in_zip = repo_root_dir_in_zip + normalized_folder_path_for_zip + '/'
-            else:
-                search_prefix_in_zip = repo_root_dir_in_zip
+        normalized_folder_path_for_zip = folder_path.strip('/').replace(os.sep, '/')
+        if normalized_folder_path_for_zip:
+            search_prefix_in_zip = repo_root_dir_in_zip + normalized_folder_path_for_zip + '/'
+        else:
+            search_prefix_in_zip = repo_root_dir_in_zip
 
-            if mf_prefix is not None:
-                # Multi-folder repo: extract each subdir individually without wiping local_save_path
-                extracted_count = _extract_multi_folder_repo(zf, search_prefix_in_zip, local_save_path, mf_prefix)
-            else:
-                files_to_extract_from_zip = []
-                for item_name in zf.namelist():
-                    if item_name.startswith(search_prefix_in_zip) and not item_name.endswith('/'):
-                        files_to_extract_from_zip.append(item_name)
-
-                if not files_to_extract_from_zip:
-                    folder_exists_as_prefix_in_zip = any(name.startswith(search_prefix_in_zip) for name in zf.namelist())
-                    if folder_exists_as_prefix_in_zip:
-                        if os.path.exists(local_save_path):
-                            shutil.rmtree(local_save_path)
-                        os.makedirs(local_save_path, exist_ok=True)
-                        return True, f"Folder '{folder_path if folder_path else 'root'}' downloaded successfully. It is empty or contains only subdirectories.", final_actual_path
-                    else:
-                        return False, f"Folder '{folder_path if folder_path else 'root'}' not found in the repository archive (searched for prefix '{search_prefix_in_zip}').", final_actual_path
-
-                # Preserve "Older Versions" folder if it exists
-                older_versions_backup = None
-                older_versions_path = os.path.join(local_save_path, "Older Versions")
-                if os.path.exists(older_versions_path):
-                    older_versions_backup = tempfile.mkdtemp()
-                    shutil.copytree(older_versions_path, os.path.join(older_versions_backup, "Older Versions"))
-                    logger.debug(f"Backed up Older Versions to: {older_versions_backup}")
-
-                if os.path.exists(local_save_path):
-                    shutil.rmtree(local_save_path)
-                logger.debug(f"Creating directory for main extraction: {local_save_path}")
-                os.makedirs(local_save_path, exist_ok=True)
-
-                # Restore "Older Versions" folder if it was backed up
-                if older_versions_backup and os.path.exists(os.path.join(older_versions_backup, "Older Versions")):
-                    shutil.copytree(os.path.join(older_versions_backup, "Older Versions"), older_versions_path)
-                    shutil.rmtree(older_versions_backup)
-                    logger.debug(f"Restored Older Versions folder")
-
-                for file_path_in_zip in files_to_extract_from_zip:
-                    relative_path = file_path_in_zip[len(search_prefix_in_zip):]
-                    local_file_path = os.path.join(local_save_path, relative_path)
+        if mf_prefix is not None:
+            # Multi-folder repo: extract each subdir individually without wiping local_save_path
+            extracted_count = _extract_multi_folder_repo(zf, search_prefix_in_zip, local_save_path, mf_prefix, chunk_size)
+        else:
+            # Final relative path of every member, with the main.lua lift already applied
+            files_to_extract_from_zip = _zip_member_targets(zf, search_prefix_in_zip)
+
+            if not files_to_extract_from_zip:
+                folder_exists_as_prefix_in_zip = any(name.startswith(search_prefix_in_zip) for name in zf.namelist())
+                if not folder_exists_as_prefix_in_zip:
+                    return False, f"Folder '{folder_path if folder_path else 'root'}' not found in the repository archive (searched for prefix '{search_prefix_in_zip}').", final_actual_path
+
+            # Extract into a sibling staging dir and swap it in, so the script is never half-written
+            staging_parent = os.path.dirname(os.path.abspath(local_save_path))
+            os.makedirs(staging_parent, exist_ok=True)
+            staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=staging_parent)
+            try:
+                for relative_path, file_path_in_zip in files_to_extract_from_zip.items():
+                    local_file_path = os.path.join(staging_dir, relative_path.replace('/', os.sep))
 
                     parent_dir = os.path.dirname(local_file_path)
                     if parent_dir and not os.path.exists(parent_dir):
                         os.makedirs(parent_dir)
 
-                    with open(local_file_path, 'wb') as f_out:
-                        f_out.write(zf.read(file_path_in_zip))
+                    _copy_zip_member(zf, file_path_in_zip, local_file_path, chunk_size)
                     extracted_count += 1
 
-        if extracted_count > 0:
-            if mf_prefix is None:
-                # --- Lua Script Restructuring Logic ---
-                if not os.path.exists(os.path.join(local_save_path, "main.lua")):
-                    logger.debug(f"Restructure: main.lua not found in root of {local_save_path}. Checking subdirectories.")
-                    items_in_root = os.listdir(local_save_path)
-                    subdirs = [item for item in items_in_root if os.path.isdir(os.path.join(local_save_path, item))]
-
-                    if len(subdirs) == 1:
-                        single_subdir_name = subdirs[0]
-                        single_subdir_path = os.path.join(local_save_path, single_subdir_name)
-                        if os.path.exists(os.path.join(single_subdir_path, "main.lua")):
-                            logger.debug(f"Restructure: Found main.lua in single subdirectory '{single_subdir_name}'. Restructuring.")
-                            temp_restructure_dir = local_save_path + "_temp_restructure_dir"
-                            if os.path.exists(temp_restructure_dir):
-                                shutil.rmtree(temp_restructure_dir)
-                            os.makedirs(temp_restructure_dir)
-
-                            for item in os.listdir(single_subdir_path):
-                                shutil.move(os.path.join(single_subdir_path, item), os.path.join(temp_restructure_dir, item))
-
-                            shutil.rmtree(single_subdir_path)
-
-                            for item in os.listdir(temp_restructure_dir):
-                                shutil.move(os.path.join(temp_restructure_dir, item), os.path.join(local_save_path, item))
-
-                            shutil.rmtree(temp_restructure_dir)
-                            logger.debug(f"Restructure: Successfully moved contents from '{single_subdir_name}' to '{local_save_path}'.")
-                # --- End of Lua Script Restructuring Logic ---
-            return True, f"Folder '{folder_path if folder_path else 'root'}' downloaded successfully. Extracted {extracted_count} files.", final_actual_path
-        else:
-            return False, f"Folder '{folder_path if folder_path else 'root'}' was processed, but no files were ultimately extracted.", final_actual_path
+                _swap_in_staged_tree(staging_dir, local_save_path, archive_sha)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+            if not files_to_extract_from_zip:
+                return True, f"Folder '{folder_path if folder_path else 'root'}' downloaded successfully. It is empty or contains only subdirectories.", final_actual_path
+
+    if extracted_count > 0:
+        return True, f"Folder '{folder_path if folder_path else 'root'}' downloaded successfully. Extracted {extracted_count} files.", final_actual_path
+    else:
+        return False, f"Folder '{folder_path if folder_path else 'root'}' was processed, but no files were ultimately extracted.", final_actual_path
+
+def _resolve_repo_ref(repo_url, branch=None):
+    """Returns (user, repo_name, ref) for a download: the branch from the URL or hint, else the cached default branch."""
+    branch_explicitly_set = "/tree/" in repo_url or bool(branch)
+    effective_branch = determine_effective_branch(repo_url, branch)
+
+    api_url_base = repo_url.split('/tree/')[0] if "/tree/" in repo_url else repo_url
+    user, repo_name = api_url_base.strip('/').split('/')[-2:]
+
+    if not branch_explicitly_set:
+        effective_branch = get_default_branch(user, repo_name, effective_branch)
+        logger.debug(f"Resolved default branch: {effective_branch}")
+    return user, repo_name, effective_branch
+
+def download_folder_from_github(repo_url, folder_path, local_save_path, branch=None, engine=None, archive_sha=None):
+    """Downloads a specific folder from a GitHub repository.
+
+    Args:
+        repo_url (str): The URL of the GitHub repository (e.g., https://github.com/user/repo).
+        folder_path (str): The path to the folder within the repository (e.g., 'src/my_folder' or '' for root).
+        local_save_path (str): The local directory where the folder contents should be saved.
+        branch (str): The branch to download from (defaults to 'Main').
+        engine (str): 'zipball' or 'tarball' (defaults to the archive_engine setting). The tarball
+            engine extracts while downloading; the zipball engine downloads first, then extracts.
+        archive_sha (str): If given, the replaced tree is archived as this commit by moving
+            its files into the version store (only when the folder is swapped in as a whole).
+
+    Returns:
+        tuple: (bool, str, str) indicating (success_status, message, final_script_path).
+    """
+    try:
+        user, repo_name, effective_branch = _resolve_repo_ref(repo_url, branch)
+        mf_prefix = _get_multi_folder_prefix(repo_url)
+
+        engine = engine or config_manager.get_archive_engine()
+        download = _download_folder_via_tarball if engine == 'tarball' else _download_folder_via_zipball
+        started = time.monotonic()
+        try:
+            result = download(user, repo_name, effective_branch, folder_path, local_save_path, mf_prefix, archive_sha)
+        except requests.exceptions.HTTPError as e:
+            # A cached default branch that 404s was probably renamed; resolve it again and retry once
+            branch_explicitly_set = "/tree/" in repo_url or bool(branch)
+            if branch_explicitly_set or e.response is None or e.response.status_code != 404:
+                raise
+            resolved_branch = get_default_branch(user, repo_name, effective_branch, refresh=True)
+            if resolved_branch == effective_branch:
+                raise
+            logger.info(f"Default branch of {user}/{repo_name} is now '{resolved_branch}'; retrying the download.")
+            result = download(user, repo_name, resolved_branch, folder_path, local_save_path, mf_prefix, archive_sha)
+        logger.info(f"{engine.capitalize()} engine finished in {time.monotonic() - started:.2f}s: {result[1]}")
+        return result
 
     except requests.exceptions.RequestException as e:
         return False, f"Error downloading repository: {e}", local_save_path # Fallback path
@@ -647,23 +1131,24 @@ def get_latest_commit_sha(repo_url, branch=None):
 
     branch_explicitly_set = "/tree/" in repo_url or bool(branch)
     effective_branch = determine_effective_branch(repo_url, branch)
+    if not branch_explicitly_set:
+        # Use the cached default branch when known; saves the 422 + repo-info round-trips
+        cached = repo_cache.get_repo_cache().get(user, repo_name)
+        if cached and cached.get('default_branch'):
+            effective_branch = cached['default_branch']
 
     api_url = f"https://api.github.com/repos/{user}/{repo_name}/commits/{effective_branch}"
     try:
-        response = requests.get(api_url, headers=get_github_headers())
+        response = http_client.get(api_url, use_cache=True)
         # 422 means the branch doesn't exist; resolve the real default branch and retry once
         if response.status_code == 422 and not branch_explicitly_set:
-            try:
-                repo_info = requests.get(
-                    f"https://api.github.com/repos/{user}/{repo_name}",
-                    headers=get_github_headers()
-                )
-                repo_info.raise_for_status()
-                effective_branch = repo_info.json().get('default_branch', effective_branch)
+            resolved_branch = get_default_branch(user, repo_name, None, refresh=True)
+            if resolved_branch and resolved_branch != effective_branch:
+                effective_branch = resolved_branch
                 api_url = f"https://api.github.com/repos/{user}/{repo_name}/commits/{effective_branch}"
-                response = requests.get(api_url, headers=get_github_headers())
-            except Exception as e:
-                logger.warning(f"Could not resolve default branch for SHA lookup: {e}")
+                response = http_client.get(api_url, use_cache=True)
+            else:
+                logger.warning(f"Could not resolve default branch for SHA lookup of {user}/{repo_name}")
         response.raise_for_status()
         return response.json()['sha']
     except requests.exceptions.RequestException as e:
@@ -673,6 +1158,145 @@ def get_latest_commit_sha(repo_url, branch=None):
         logger.error(f"Error parsing commit SHA from API response for {api_url}")
         return None
 
+def _build_heads_query(targets):
+    """Builds one GraphQL query with an aliased repository field per target.
+
+    Args:
+        targets (list): (user, repo_name, branch) tuples; branch None means the default branch.
+
+    Returns:
+        tuple: (query_string, variables_dict)
+    """
+    declarations = []
+    fields = []
+    variables = {}
+    for i, (user, repo_name, branch) in enumerate(targets):
+        declarations += [f"$o{i}: String!", f"$n{i}: String!"]
+        variables[f"o{i}"] = user
+        variables[f"n{i}"] = repo_name
+        selection = "databaseId pushedAt defaultBranchRef { name target { oid } }"
+        if branch:
+            declarations.append(f"$b{i}: String!")
+            variables[f"b{i}"] = f"refs/heads/{branch}"
+            selection += f" ref(qualifiedName: $b{i}) {{ name target {{ oid }} }}"
+        fields.append(f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ {selection} }}")
+    query = f"query({', '.join(declarations)}) {{ {' '.join(fields)} }}"
+    return query, variables
+
+def _resolve_heads_graphql(targets, graphql_url):
+    """Resolves default branch and head SHA for each target via batched GraphQL.
+
+    Returns:
+        dict: {target: {'sha': str or None, 'default_branch': str or None}} for every
+              target that GraphQL answered. Targets missing from the result (transport
+              or query failure) should be retried over REST.
+    """
+    resolved = {}
+    for start in range(0, len(targets), GRAPHQL_BATCH_SIZE):
+        chunk = targets[start:start + GRAPHQL_BATCH_SIZE]
+        query, variables = _build_heads_query(chunk)
+        try:
+            response = http_client.post(graphql_url, json={'query': query, 'variables': variables})
+            response.raise_for_status()
+            data = response.json().get('data')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"GraphQL head lookup failed for {len(chunk)} repos, falling back to REST: {e}")
+            continue
+        if not data:
+            logger.warning(f"GraphQL head lookup returned no data for {len(chunk)} repos, falling back to REST")
+            continue
+
+        for i, target in enumerate(chunk):
+            repo = data.get(f"r{i}")
+            if repo is None:
+                # Repository not found or not accessible; REST would fail the same way.
+                resolved[target] = {'sha': None, 'default_branch': None}
+                continue
+            default_ref = repo.get('defaultBranchRef') or {}
+            head_ref = repo.get('ref') if target[2] else default_ref
+            if default_ref.get('name'):
+                repo_cache.get_repo_cache().put(target[0], target[1], default_ref['name'],
+                                                repo.get('databaseId'), repo.get('pushedAt'))
+            resolved[target] = {
+                'sha': ((head_ref or {}).get('target') or {}).get('oid'),
+                'default_branch': default_ref.get('name'),
+            }
+        logger.debug(f"GraphQL resolved {len(chunk)} repo heads in one request")
+    return resolved
+
+def iter_latest_commit_shas(scripts_data, graphql_url=None, max_workers=None, background=False):
+    """Resolves the latest commit SHA of every script's repository, yielding each as it lands.
+
+    With a GitHub token configured, all repos are resolved through a few batched
+    GraphQL requests (one aliased field per repo) instead of one or more REST
+    calls each. Repos the GraphQL pass could not answer, or every repo when no
+    token is set, are checked over REST on a bounded thread pool, so the total
+    time is roughly that of the slowest single check. Per-host concurrency is
+    capped by the shared HTTP client.
+
+    Args:
+        scripts_data (list): Managed script dicts (only 'repo_url' is used).
+        graphql_url (str): GraphQL endpoint override, e.g. a local stand-in for testing.
+        max_workers (int): REST worker threads (defaults to the update_check_workers setting).
+        background (bool): Run the lookups at background priority, so they yield to
+            user-initiated requests and are deferred when the rate-limit budget is low
+            (deferred repos are yielded with sha None; see background_check_deferred_until()).
+
+    Yields:
+        tuple: (repo_url, sha or None), once per distinct repo_url, in completion order.
+    """
+    targets = {}  # (user, repo_name, branch) -> [repo_url, ...]
+    seen = set()
+    for script in scripts_data:
+        repo_url = script.get('repo_url')
+        if not repo_url or repo_url in seen:
+            continue
+        seen.add(repo_url)
+        try:
+            user, repo_name = _split_repo_url(repo_url)
+        except ValueError:
+            logger.error(f"Invalid GitHub repository URL, skipping SHA lookup: {repo_url}")
+            yield repo_url, None
+            continue
+        branch = determine_effective_branch(repo_url) if "/tree/" in repo_url else None
+        targets.setdefault((user, repo_name, branch), []).append(repo_url)
+
+    if not targets:
+        return
+
+    pending = dict(targets)
+    if 'Authorization' in get_github_headers():
+        with rate_limiter.background_priority() if background else nullcontext():
+            resolved = _resolve_heads_graphql(list(targets), graphql_url or GITHUB_GRAPHQL_URL)
+        for target, info in resolved.items():
+            for repo_url in pending.pop(target):
+                yield repo_url, info['sha']
+
+    if not pending:
+        return
+
+    workers = max(1, min(max_workers or config_manager.get_update_check_workers(), len(pending)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sha-check') as executor:
+        futures = {executor.submit(_check_latest_commit_sha, repo_urls[0], background): repo_urls
+                   for repo_urls in pending.values()}
+        for future in as_completed(futures):
+            try:
+                sha = future.result()
+            except Exception as e:
+                logger.error(f"Unexpected error checking {futures[future][0]}: {e}")
+                sha = None
+            for repo_url in futures[future]:
+                yield repo_url, sha
+
+def _check_latest_commit_sha(repo_url, background):
+    """get_latest_commit_sha() for worker threads, optionally at background priority."""
+    with rate_limiter.background_priority() if background else nullcontext():
+        return get_latest_commit_sha(repo_url)
+
+def background_check_deferred_until():
+    """Returns the reset timestamp while background checks are deferred by the rate limit, else None."""
+    return rate_limiter.get_scheduler().deferred_until('core')
+
 def archive_current_version(script_path, commit_sha):
     """Archives the current version of a script before updating.
     
@@ -696,25 +1320,37 @@ def archive_current_version(script_path, commit_sha):
         return False
 
 def find_existing_archive_by_sha(older_versions_dir, sha_short):
-    """Find an existing archive folder that contains the specified SHA.
+    """Find an existing archived version that contains the specified SHA.
     
     Args:
         older_versions_dir (str): Path to the Older Versions directory
         sha_short (str): Short SHA (8 characters) to search for
         
     Returns:
-        str or None: Name of the existing archive folder, or None if not found
+        str or None: Name of the existing archived version, or None if not found
     """
-    if not os.path.exists(older_versions_dir):
+    if not os.path.isdir(older_versions_dir):
+        return None
+    return version_store.VersionStore(os.path.dirname(older_versions_dir)).find_by_sha(sha_short)
+
+def new_version_id(script_path, commit_sha, context):
+    """Returns the name a new archive of commit_sha would get under "Older Versions",
+    or None if that SHA is already archived."""
+    older_versions_dir = os.path.join(script_path, "Older Versions")
+    existing_archive = find_existing_archive_by_sha(older_versions_dir, commit_sha[:8])
+    if existing_archive:
+        logger.info(f"SHA {commit_sha[:8]} already archived in: {existing_archive}")
         return None
-    
-    for folder_name in os.listdir(older_versions_dir):
-        if sha_short in folder_name:
-            return folder_name
-    return None
+
+    from datetime import datetime
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return f"{timestamp}_{commit_sha[:8]}_{context}"
 
 def archive_current_version_smart(script_path, commit_sha, context):
     """Archive current version with smart deduplication.
+
+    The version goes into the script's content-addressed version store, so only
+    files whose content isn't stored yet are copied.
     
     Args:
         script_path (str): Path to the script folder
@@ -725,59 +1361,41 @@ def archive_current_version_smart(script_path, commit_sha, context):
         bool: True if archiving was successful, False otherwise
     """
     try:
-        older_versions_dir = os.path.join(script_path, "Older Versions")
-        
-        # Check if this SHA already exists
-        existing_archive = find_existing_archive_by_sha(older_versions_dir, commit_sha[:8])
-        if existing_archive:
-            logger.info(f"SHA {commit_sha[:8]} already archived in: {existing_archive}")
+        version_id = new_version_id(script_path, commit_sha, context)
+        if version_id is None:
             return True  # No need to create duplicate
         
-        # Create new archive since SHA doesn't exist
-        os.makedirs(older_versions_dir, exist_ok=True)
-        
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        archive_folder_name = f"{timestamp}_{commit_sha[:8]}_{context}"
-        archive_path = os.path.join(older_versions_dir, archive_folder_name)
-        
-        if os.path.exists(archive_path):
-            shutil.rmtree(archive_path)
-        os.makedirs(archive_path)
-        
-        for item in os.listdir(script_path):
-            if item != "Older Versions":
-                item_path = os.path.join(script_path, item)
-                dest_path = os.path.join(archive_path, item)
-                if os.path.isdir(item_path):
-                    shutil.copytree(item_path, dest_path)
-                else:
-                    shutil.copy2(item_path, dest_path)
-        
-        logger.info(f"Archived current version to: {archive_path}")
+        version_store.VersionStore(script_path).archive(script_path, version_id, commit_sha, context,
+                                                        hashes=version_store.tree_hashes(script_path))
         return True
         
     except Exception as e:
         logger.error(f"Failed to archive current version: {e}")
         return False
 
-def restore_version(script_path, version_folder_name, current_sha=None):
+def restore_version(script_path, version_folder_name, current_sha=None, retention=None):
     """Restores a specific version from the archive.
+
+    The version is materialised into a staging directory (from the version store,
+    extracted from its pack, or copied from a legacy version folder) and swapped in.
     
     Args:
         script_path (str): Path to the script folder
-        version_folder_name (str): Name of the version folder to restore
+        version_folder_name (str): Name of the version to restore
         current_sha (str): SHA of the currently active version (if known)
+        retention (dict): The script's own retention policy keys; old versions are
+            pruned in the background afterwards
         
     Returns:
         bool: True if restoration was successful, False otherwise
     """
     try:
         older_versions_dir = os.path.join(script_path, "Older Versions")
-        version_path = os.path.join(older_versions_dir, version_folder_name)
+        store = version_store.VersionStore(script_path)
+        legacy_path = os.path.join(older_versions_dir, version_folder_name)
         
-        if not os.path.exists(version_path):
-            logger.error(f"Version folder does not exist: {version_path}")
+        if not store.has_version(version_folder_name) and not os.path.isdir(legacy_path):
+            logger.error(f"Version does not exist: {version_folder_name}")
             return False
         
         # Smart deduplication: Check if current SHA already has an archive
@@ -793,49 +1411,65 @@ def restore_version(script_path, version_folder_name, current_sha=None):
             # We don't have SHA info, create archive with timestamp
             from datetime import datetime
             timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            archive_name = f"{timestamp}_active_before-restore"
-            archive_path = os.path.join(older_versions_dir, archive_name)
-            
-            if os.path.exists(archive_path):
-                shutil.rmtree(archive_path)
-            os.makedirs(archive_path)
-            
-            for item in os.listdir(script_path):
-                if item != "Older Versions":
-                    item_path = os.path.join(script_path, item)
-                    dest_path = os.path.join(archive_path, item)
-                    if os.path.isdir(item_path):
-                        shutil.copytree(item_path, dest_path)
-                    else:
-                        shutil.copy2(item_path, dest_path)
-            
-            logger.info(f"Archived current version before restore to: {archive_path}")
+            store.archive(script_path, f"{timestamp}_active_before-restore", context="before-restore",
+                          hashes=version_store.tree_hashes(script_path))
         
-        # Remove current files (except Older Versions)
-        for item in os.listdir(script_path):
-            if item != "Older Versions":
-                item_path = os.path.join(script_path, item)
-                if os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-                else:
-                    os.remove(item_path)
-        
-        # Copy files from the selected version
-        for item in os.listdir(version_path):
-            src_path = os.path.join(version_path, item)
-            dest_path = os.path.join(script_path, item)
-            if os.path.isdir(src_path):
-                shutil.copytree(src_path, dest_path)
+        staging_parent = os.path.dirname(os.path.abspath(script_path))
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=staging_parent)
+        try:
+            if store.has_version(version_folder_name):
+                store.restore(version_folder_name, staging_dir)
             else:
-                shutil.copy2(src_path, dest_path)
+                for item in os.listdir(legacy_path):
+                    src_path = os.path.join(legacy_path, item)
+                    dest_path = os.path.join(staging_dir, item)
+                    if os.path.isdir(src_path):
+                        shutil.copytree(src_path, dest_path)
+                    else:
+                        shutil.copy2(src_path, dest_path)
+            _swap_in_staged_tree(staging_dir, script_path)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
         
+        # Restored copies keep their archived mtimes, so rebuild the manifest from scratch
+        file_manifest.update_manifest(script_path, rehash=True)
         logger.info(f"Restored version: {version_folder_name}")
+        prune_versions_in_background(script_path, retention)
         return True
         
     except Exception as e:
         logger.error(f"Failed to restore version: {e}")
         return False
 
+def prune_versions(script_path, retention=None):
+    """Applies the retention policy to a script's archived versions.
+    
+    Args:
+        script_path (str): Path to the script folder
+        retention (dict): The script's own policy keys, overriding the global policy
+        
+    Returns:
+        tuple: (int, int) number of versions evicted and bytes reclaimed
+    """
+    try:
+        policy = config_manager.get_retention_policy()
+        policy.update(retention or {})
+        if all(value is None for value in policy.values()) or not os.path.isdir(os.path.join(script_path, "Older Versions")):
+            return 0, 0
+        evicted, reclaimed = version_store.VersionStore(script_path).prune(policy)
+        if evicted:
+            logger.info(f"Pruned {len(evicted)} archived versions of {script_path}, "
+                        f"reclaimed {reclaimed / (1024 * 1024):.1f} MB: {', '.join(evicted)}")
+        return len(evicted), reclaimed
+        
+    except Exception as e:
+        logger.error(f"Failed to prune archived versions: {e}")
+        return 0, 0
+
+def prune_versions_in_background(script_path, retention=None):
+    """Runs prune_versions on a daemon thread."""
+    threading.Thread(target=prune_versions, args=(script_path, retention), daemon=True).start()
+
 def get_available_versions(script_path):
     """Gets a list of available archived versions for a script.
     
@@ -843,137 +1477,445 @@ def get_available_versions(script_path):
         script_path (str): Path to the script folder
         
     Returns:
-        list: List of version folder names, sorted by date (newest first)
+        list: List of version names, sorted by date (newest first)
+    """
+    return [entry['id'] for entry in get_version_details(script_path)]
+
+def get_version_details(script_path):
+    """Gets the version index entries (id, sha, timestamp, context, files, bytes) of a
+    script's archived versions, newest first, without walking the archives.
+    
+    Returns:
+        list: List of dicts, or an empty list if there are none or the index can't be read
     """
     try:
-        older_versions_dir = os.path.join(script_path, "Older Versions")
-        if not os.path.exists(older_versions_dir):
+        if not os.path.isdir(os.path.join(script_path, "Older Versions")):
             return []
-        
-        versions = []
-        for item in os.listdir(older_versions_dir):
-            item_path = os.path.join(older_versions_dir, item)
-            if os.path.isdir(item_path):
-                versions.append(item)
-        
-        # Sort by creation time (newest first)
-        versions.sort(key=lambda x: os.path.getctime(os.path.join(older_versions_dir, x)), reverse=True)
-        return versions
+        return version_store.VersionStore(script_path).list_entries()
         
     except Exception as e:
         logger.error(f"Failed to get available versions: {e}")
         return []
 
-def differential_update_from_github(repo_url, folder_path, local_save_path, branch=None):
+def _fetch_folder_tree(user, repo_name, ref, folder_path):
+    """Lists the files under folder_path at ref using the git trees API.
+
+    Returns:
+        tuple or None: ({relative_path: (blob_sha, size)}, folder_seen), or None if
+        GitHub truncated the listing and it can't be trusted.
+    """
+    response = http_client.get(f"https://api.github.com/repos/{user}/{repo_name}/git/trees/{ref}?recursive=1")
+    response.raise_for_status()
+    tree_data = response.json()
+    if tree_data.get('truncated'):
+        return None
+
+    normalized_folder = folder_path.strip('/').replace(os.sep, '/')
+    blobs = {}
+    folder_seen = not normalized_folder
+    for item in tree_data.get('tree', []):
+        path = item['path']
+        if normalized_folder:
+            if path == normalized_folder:
+                folder_seen = True
+                continue
+            if not path.startswith(normalized_folder + '/'):
+                continue
+            folder_seen = True
+            path = path[len(normalized_folder) + 1:]
+        # Symlinks (120000) and submodules are not regular files in an archive either
+        if item['type'] == 'blob' and item.get('mode') != '120000':
+            blobs[path] = (item['sha'], item.get('size', 0))
+    return blobs, folder_seen
+
+def _lifted_subdir(paths):
+    """Returns the subfolder the main.lua restructure lifts to the root for these paths, or None.
+
+    Mirrors what download_folder_from_github does on disk: if there is no
+    root main.lua and the only subdirectory holds one, that subdirectory's
+    contents move up to the root.
+    """
+    if 'main.lua' in paths:
+        return None
+    subdirs = {path.split('/', 1)[0] for path in paths if '/' in path}
+    if len(subdirs) != 1:
+        return None
+    subdir = subdirs.pop()
+    return subdir if f"{subdir}/main.lua" in paths else None
+
+def _installed_rel_path(relative, mf_prefix=None, lifted_subdir=None):
+    """Returns where a path relative to folder_path ends up under local_save_path
+    ('/'-separated), or None if a download doesn't install it."""
+    parts = relative.split('/')
+    if mf_prefix is not None:
+        if len(parts) == 1:
+            if parts[0].lower().startswith('readme') or parts[0] in ('.gitignore', '.gitattributes'):
+                return None
+        elif not parts[0].lower().startswith(mf_prefix.lower()):
+            parts[0] = mf_prefix + parts[0]
+    elif lifted_subdir and len(parts) > 1 and parts[0] == lifted_subdir:
+        parts = parts[1:]
+    if parts[0] == "Older Versions":
+        return None
+    return '/'.join(parts)
+
+def _installed_layout(files, mf_prefix=None):
+    """Maps {path relative to folder_path: value} to {installed relative path: value}.
+
+    Applies the same layout rules as a full download: multi-folder prefixing
+    (skipping top-level readme/.git* files) or the main.lua lift. Entries under
+    "Older Versions" are dropped.
+    """
+    lifted_subdir = _lifted_subdir(files) if mf_prefix is None else None
+    layout = {}
+    # Lifted files go last so they win over same-named root files, as the on-disk move did
+    for relative in sorted(files, key=lambda path: bool(lifted_subdir) and path.startswith(lifted_subdir + '/')):
+        installed = _installed_rel_path(relative, mf_prefix, lifted_subdir)
+        if installed is not None:
+            layout[installed] = files[relative]
+    return layout
+
+def _download_raw_file(user, repo_name, ref, repo_path, blob_sha, size, dest_path, chunk_size):
+    """Downloads repo_path at ref from raw.githubusercontent.com and verifies it against blob_sha.
+
+    Raw downloads don't count against the API rate limit, so fetching changed
+    files one by one costs no more of it than the archive does. ref should be a
+    commit SHA where one is known: raw content for a branch may be served from
+    a cache that lags behind a push, which then fails the verification.
+    """
+    raw_url = f"https://raw.githubusercontent.com/{user}/{repo_name}/{ref}/{quote(repo_path)}"
+    blob_hash = hashlib.sha1(b"blob %d\0" % size) if size is not None else None
+    with http_client.get(raw_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(dest_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    if blob_hash:
+                        blob_hash.update(chunk)
+    downloaded_sha = blob_hash.hexdigest() if blob_hash else calculate_git_blob_sha(dest_path)
+    if downloaded_sha != blob_sha:
+        raise IOError(f"Downloaded file {repo_path} failed verification.")
+
+def _tree_differential_update(repo_url, folder_path, local_save_path, branch=None, target_sha=None):
+    """Tree engine for differential_update_from_github.
+
+    Compares the blob SHAs of folder_path's git tree with git blob hashes of the
+    local files and downloads only the blobs that differ, so an update that
+    touches a few files transfers a few files. Changed files are fetched from
+    raw.githubusercontent.com in parallel into a sibling staging directory and
+    only moved into place once all of them arrived and verified. Local files
+    that are not in the tree are left alone, like the archive engine does.
+    With target_sha the tree is listed and fetched at that commit.
+
+    Returns:
+        tuple or None: The differential_update_from_github result, or None if the
+        tree can't be used (truncated listing, too many changes) and the caller
+        should fall back to the archive.
+    """
+    folder_label = folder_path if folder_path else 'root'
+    user, repo_name, ref = _resolve_repo_ref(repo_url, branch)
+    ref = target_sha or ref
+    listing = _fetch_folder_tree(user, repo_name, ref, folder_path)
+    if listing is None:
+        logger.info(f"Tree listing for {user}/{repo_name} is truncated; using the archive instead.")
+        return None
+    blobs, folder_seen = listing
+    if not folder_seen:
+        return False, f"Folder '{folder_label}' not found in the repository.", local_save_path
+
+    manifest = file_manifest.load_manifest(local_save_path)
+    mf_prefix = _get_multi_folder_prefix(repo_url)
+    repo_prefix = folder_path.strip('/').replace(os.sep, '/')
+    repo_prefix = repo_prefix + '/' if repo_prefix else ''
+    targets = _installed_layout({relative: (blob_sha, size, repo_prefix + relative)
+                                 for relative, (blob_sha, size) in blobs.items()}, mf_prefix)
+    # The blob size is part of its hash, so a size mismatch means changed without reading the file.
+    # The rest are hashed in one parallel batch; the manifest answers for files untouched since last time.
+    local_hashes = manifest.get_hashes(targets, 'git', {rel_path: size for rel_path, (_, size, _) in targets.items()})
+    changed = []  # (relative_path, blob_sha, size, is_new, repo_path)
+    for rel_path, (blob_sha, size, repo_path) in targets.items():
+        if local_hashes.get(rel_path) == blob_sha:
+            continue
+        is_new = not os.path.isfile(os.path.join(local_save_path, rel_path.replace('/', os.sep)))
+        changed.append((rel_path, blob_sha, size, is_new, repo_path))
+
+    manifest.save()
+    logger.info(f"Tree differential: {len(changed)} of {len(blobs)} files changed.")
+    if not changed:
+        return True, "No file changes detected. All files are already up to date.", local_save_path
+    if len(changed) > DIFF_MAX_BLOBS:
+        logger.info(f"{len(changed)} files changed (more than {DIFF_MAX_BLOBS}); using the archive instead.")
+        return None
+
+    download = config_manager.get_download_settings()
+    parent_dir = os.path.dirname(os.path.abspath(local_save_path))
+    os.makedirs(parent_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=parent_dir)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(download['asset_workers'], len(changed)))) as executor:
+            futures = [executor.submit(_download_raw_file, user, repo_name, ref, repo_path, blob_sha, size,
+                                       os.path.join(staging_dir, str(index)), download['chunk_size'])
+                       for index, (_, blob_sha, size, _, repo_path) in enumerate(changed)]
+            for future in as_completed(futures):
+                future.result()
+
+        for index, (rel_path, blob_sha, _, is_new, _) in enumerate(changed):
+            local_file_path = os.path.join(local_save_path, rel_path.replace('/', os.sep))
+            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            os.replace(os.path.join(staging_dir, str(index)), local_file_path)
+            manifest.record(rel_path, 'git', blob_sha)
+            logger.debug(f"{'Added' if is_new else 'Updated'} file: {rel_path}")
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        manifest.save()
+
+    files_added = sum(1 for change in changed if change[3])
+    files_updated = len(changed) - files_added
+    logger.info(f"Tree differential fetched {sum(change[2] for change in changed)} bytes in {len(changed)} files.")
+    return True, f"Differential update completed successfully. {files_updated} files updated, {files_added} files added.", local_save_path
+
+def _compare_incremental_update(repo_url, folder_path, local_save_path, base_sha, head_sha, branch=None):
+    """Applies only the files changed between base_sha and head_sha, as reported by the compare API.
+
+    Changed files under folder_path are fetched from raw.githubusercontent.com
+    at head_sha in parallel into a sibling staging directory; once all
+    arrived, removed files are deleted,
+    renames move the old local file (when the content is unchanged) and the
+    rest are moved into place.
+
+    Returns:
+        tuple or None: The perform_update result, or None if the comparison can't
+        be applied (unknown SHA, history rewritten, too many files, layout change)
+        and the caller should fall back to a full download.
+    """
+    user, repo_name, _ = _resolve_repo_ref(repo_url, branch)
+    # Not cached: each SHA pair is compared once, and compare bodies (with patches) are large
+    response = http_client.get(f"https://api.github.com/repos/{user}/{repo_name}/compare/{base_sha}...{head_sha}")
+    if response.status_code in (404, 422):
+        logger.info(f"Compare {base_sha[:7]}...{head_sha[:7]} unavailable for {user}/{repo_name}; doing a full download.")
+        return None
+    response.raise_for_status()
+    comparison = response.json()
+    changed_files = comparison.get('files', [])
+    if comparison.get('status') not in ('ahead', 'identical'):
+        # behind/diverged: the compare diff starts at the merge base, not at base_sha
+        logger.info(f"{base_sha[:7]} is {comparison.get('status')} of {head_sha[:7]}; doing a full download.")
+        return None
+    if len(changed_files) >= COMPARE_MAX_FILES or len(changed_files) > DIFF_MAX_BLOBS:
+        logger.info(f"Comparison lists {len(changed_files)} files; doing a full download.")
+        return None
+
+    normalized_folder = folder_path.strip('/').replace(os.sep, '/')
+    prefix = normalized_folder + '/' if normalized_folder else ''
+    mf_prefix = _get_multi_folder_prefix(repo_url)
+
+    def in_folder(path):
+        return bool(path) and path.startswith(prefix) and path[len(prefix):].split('/', 1)[0] != "Older Versions"
+
+    relevant = [f for f in changed_files if in_folder(f['filename']) or in_folder(f.get('previous_filename'))]
+    if not relevant:
+        return True, "No file changes detected. All files are already up to date.", local_save_path
+
+    lifted_subdir = None
+    if mf_prefix is None:
+        listing = _fetch_folder_tree(user, repo_name, head_sha, normalized_folder)
+        if listing is None or not listing[1]:
+            return None
+        head_paths = set(listing[0])
+        # The folder at base_sha is the one at head_sha with the comparison undone
+        base_paths = set(head_paths)
+        for f in relevant:
+            if in_folder(f['filename']):
+                relative = f['filename'][len(prefix):]
+                if f['status'] == 'removed':
+                    base_paths.add(relative)
+                elif f['status'] in ('added', 'renamed', 'copied'):
+                    base_paths.discard(relative)
+            if f['status'] == 'renamed' and in_folder(f.get('previous_filename')):
+                base_paths.add(f['previous_filename'][len(prefix):])
+        lifted_subdir = _lifted_subdir(head_paths)
+        if lifted_subdir != _lifted_subdir(base_paths):
+            logger.info("Folder layout (main.lua restructure) changed between versions; doing a full download.")
+            return None
+
+    def local_path_for(path):
+        """Installed location of a repo path, or None if it isn't installed."""
+        if not in_folder(path):
+            return None
+        rel_path = _installed_rel_path(path[len(prefix):], mf_prefix, lifted_subdir)
+        return os.path.join(local_save_path, rel_path.replace('/', os.sep)) if rel_path else None
+
+    removals = []   # local paths
+    moves = []      # (old local path, new local path) for pure renames
+    fetches = []    # (blob_sha, repo path, new local path)
+    for f in relevant:
+        status = f['status']
+        new_path = None if status == 'removed' else f['filename']
+        if status == 'renamed':
+            old_path = f.get('previous_filename')
+        else:
+            old_path = None if status in ('added', 'copied') else f['filename']
+        old_local, new_local = local_path_for(old_path), local_path_for(new_path)
+        if status == 'renamed' and f.get('changes') == 0 and old_local and new_local and os.path.isfile(old_local):
+            moves.append((old_local, new_local))
+            continue
+        if old_local and old_local != new_local:
+            removals.append(old_local)
+        if new_local and status != 'unchanged':
+            fetches.append((f['sha'], new_path, new_local))
+
+    download = config_manager.get_download_settings()
+    parent_dir = os.path.dirname(os.path.abspath(local_save_path))
+    os.makedirs(parent_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=parent_dir)
+    try:
+        if fetches:
+            with ThreadPoolExecutor(max_workers=max(1, min(download['asset_workers'], len(fetches)))) as executor:
+                futures = [executor.submit(_download_raw_file, user, repo_name, head_sha, repo_path, blob_sha, None,
+                                           os.path.join(staging_dir, str(index)), download['chunk_size'])
+                           for index, (blob_sha, repo_path, _) in enumerate(fetches)]
+                for future in as_completed(futures):
+                    future.result()
+
+        files_added = sum(1 for _, _, local_file_path in fetches if not os.path.exists(local_file_path))
+        for old_local_path, new_local_path in moves:
+            os.makedirs(os.path.dirname(new_local_path), exist_ok=True)
+            os.replace(old_local_path, new_local_path)
+        for local_file_path in removals:
+            if os.path.isfile(local_file_path):
+                os.remove(local_file_path)
+                _prune_empty_dirs(os.path.dirname(local_file_path), local_save_path)
+        manifest = file_manifest.load_manifest(local_save_path)
+        for index, (blob_sha, _, local_file_path) in enumerate(fetches):
+            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            os.replace(os.path.join(staging_dir, str(index)), local_file_path)
+            manifest.record(os.path.relpath(local_file_path, local_save_path).replace(os.sep, '/'), 'git', blob_sha)
+        manifest.save()
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    files_updated = len(fetches) - files_added
+    logger.info(f"Incremental update {base_sha[:7]}...{head_sha[:7]}: {files_updated} updated, {files_added} added, "
+                f"{len(removals)} removed, {len(moves)} renamed.")
+    return True, (f"Incremental update completed successfully. {files_updated} files updated, {files_added} files added, "
+                  f"{len(removals)} files removed, {len(moves)} files renamed."), local_save_path
+
+def _prune_empty_dirs(directory, stop_at):
+    """Removes directory and its parents while they are empty, never removing stop_at itself."""
+    stop_at = os.path.abspath(stop_at)
+    directory = os.path.abspath(directory)
+    while directory != stop_at and directory.startswith(stop_at + os.sep) and not os.listdir(directory):
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+def differential_update_from_github(repo_url, folder_path, local_save_path, branch=None, target_sha=None):
     """Downloads and applies only changed files from a GitHub repository.
-    
+
+    Uses the git tree to fetch just the changed files when it can, and falls
+    back to downloading the archive and comparing every file otherwise.
+
     Args:
         repo_url (str): The URL of the GitHub repository
         folder_path (str): The path to the folder within the repository
         local_save_path (str): The local directory where files should be updated
         branch (str): The branch to download from (defaults to main/master)
+        target_sha (str): Commit to update to, if known; pins the changed files to it
         
     Returns:
         tuple: (bool, str, str) indicating (success_status, message, final_script_path)
     """
+    logger.info(f"Starting differential update for {repo_url}")
     try:
-        logger.info(f"Starting differential update for {repo_url}")
-        
-        # Preserve "Older Versions" folder if it exists
-        older_versions_backup = None
-        older_versions_path = os.path.join(local_save_path, "Older Versions")
-        if os.path.exists(older_versions_path):
-            older_versions_backup = tempfile.mkdtemp()
-            shutil.copytree(older_versions_path, os.path.join(older_versions_backup, "Older Versions"))
-            logger.debug(f"Backed up Older Versions to: {older_versions_backup}")
-        
-        # Download to temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            logger.debug(f"Downloading to temporary directory: {temp_dir}")
-            
-            # Use existing download logic to get the repository content
-            success, message, temp_path = download_folder_from_github(repo_url, folder_path, temp_dir, branch)
-            
-            if not success:
-                return False, f"Failed to download repository for comparison: {message}", local_save_path
-            
-            # Ensure local directory exists
+        result = _tree_differential_update(repo_url, folder_path, local_save_path, branch, target_sha)
+        if result is not None:
+            return result
+    except (requests.exceptions.RequestException, IOError) as e:
+        logger.warning(f"Tree differential failed ({e}); using the archive instead.")
+    return _archive_differential_update(repo_url, folder_path, local_save_path, branch)
+
+def _zip_member_targets(zf, search_prefix_in_zip, mf_prefix=None):
+    """Maps local relative paths ('/'-separated) to the zip members that land there (see _installed_layout)."""
+    members = {item_name[len(search_prefix_in_zip):]: item_name for item_name in zf.namelist()
+               if item_name.startswith(search_prefix_in_zip) and not item_name.endswith('/')}
+    return _installed_layout(members, mf_prefix)
+
+def _archive_differential_update(repo_url, folder_path, local_save_path, branch=None):
+    """Archive engine for differential_update_from_github.
+
+    Compares the zipball's central directory (CRC32 and size of every member)
+    against the local files' CRC32s from the manifest, without extracting
+    anything. Only members that differ are decompressed, each straight to its
+    final location through a sibling .part file; "Older Versions" is never
+    touched.
+    """
+    try:
+        folder_label = folder_path if folder_path else 'root'
+        user, repo_name, ref = _resolve_repo_ref(repo_url, branch)
+        download_settings = config_manager.get_download_settings()
+        chunk_size = download_settings['chunk_size']
+        archive_url = f"https://api.github.com/repos/{user}/{repo_name}/zipball/{ref}"
+        with http_client.get(archive_url, stream=True) as zip_response:
+            zip_response.raise_for_status()
+            zip_content = _download_to_spool(zip_response, chunk_size, download_settings['spool_threshold'])
+
+        with zip_content, ZipFile(zip_content) as zf:
+            if not zf.namelist():
+                return False, "Downloaded zip file is empty.", local_save_path
+            search_prefix_in_zip = zf.namelist()[0].split('/')[0] + '/'
+            normalized_folder = folder_path.strip('/').replace(os.sep, '/')
+            if normalized_folder:
+                search_prefix_in_zip += normalized_folder + '/'
+            if not any(name.startswith(search_prefix_in_zip) for name in zf.namelist()):
+                return False, f"Failed to download repository for comparison: Folder '{folder_label}' not found in the repository archive.", local_save_path
+
+            mf_prefix = _get_multi_folder_prefix(repo_url)
+            targets = _zip_member_targets(zf, search_prefix_in_zip, mf_prefix)
             os.makedirs(local_save_path, exist_ok=True)
-            
-            # Restore "Older Versions" folder if it was backed up
-            if older_versions_backup and os.path.exists(os.path.join(older_versions_backup, "Older Versions")):
-                if os.path.exists(older_versions_path):
-                    shutil.rmtree(older_versions_path)
-                shutil.copytree(os.path.join(older_versions_backup, "Older Versions"), older_versions_path)
-                logger.debug(f"Restored Older Versions folder")
-            
-            # Compare and update files
+            manifest = file_manifest.load_manifest(local_save_path)
             files_updated = 0
             files_added = 0
-            files_compared = 0
-            
-            # Walk through all files in the temporary download
-            for root, dirs, files in os.walk(temp_dir):
-                # Skip the "Older Versions" directory in comparisons
-                if "Older Versions" in dirs:
-                    dirs.remove("Older Versions")
-                
-                for file in files:
-                    temp_file_path = os.path.join(root, file)
-                    
-                    # Calculate relative path from temp_dir
-                    rel_path = os.path.relpath(temp_file_path, temp_dir)
-                    local_file_path = os.path.join(local_save_path, rel_path)
-                    
-                    files_compared += 1
-                    
-                    # Calculate hash of the new file
-                    new_file_hash = calculate_sha256(temp_file_path)
-                    if new_file_hash is None:
-                        logger.warning(f"Could not calculate hash for new file: {temp_file_path}")
-                        continue
-                    
-                    # Check if local file exists and compare hashes
-                    should_copy = True
-                    if os.path.exists(local_file_path):
-                        local_file_hash = calculate_sha256(local_file_path)
-                        if local_file_hash is not None and local_file_hash == new_file_hash:
-                            should_copy = False
-                            logger.debug(f"File unchanged, skipping: {rel_path}")
-                    
-                    if should_copy:
-                        # Ensure the directory exists
-                        local_dir = os.path.dirname(local_file_path)
-                        os.makedirs(local_dir, exist_ok=True)
-                        
-                        # Copy the file
-                        shutil.copy2(temp_file_path, local_file_path)
-                        
-                        if os.path.exists(local_file_path):
-                            files_updated += 1
-                            logger.debug(f"Updated file: {rel_path}")
-                        else:
-                            files_added += 1
-                            logger.debug(f"Added file: {rel_path}")
-            
-            # Clean up backup
-            if older_versions_backup:
-                shutil.rmtree(older_versions_backup)
-            
-            logger.info(f"Differential update completed. Files compared: {files_compared}, Updated: {files_updated}, Added: {files_added}")
-            
-            if files_updated > 0 or files_added > 0:
-                return True, f"Differential update completed successfully. {files_updated} files updated, {files_added} files added.", local_save_path
-            else:
-                return True, "No file changes detected. All files are already up to date.", local_save_path
-    
+
+            local_crcs = manifest.get_hashes(targets, 'crc32',
+                                             {rel_path: zf.getinfo(item_name).file_size for rel_path, item_name in targets.items()})
+
+            for rel_path, item_name in targets.items():
+                info = zf.getinfo(item_name)
+                member_crc = f"{info.CRC:08x}"
+                local_file_path = os.path.join(local_save_path, rel_path.replace('/', os.sep))
+                is_new = not os.path.isfile(local_file_path)
+                if local_crcs.get(rel_path) == member_crc:
+                    logger.debug(f"File unchanged, skipping: {rel_path}")
+                    continue
+
+                os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+                part_path = local_file_path + '.part'
+                _copy_zip_member(zf, item_name, part_path, chunk_size)
+                os.replace(part_path, local_file_path)
+                manifest.record(rel_path, 'crc32', member_crc)
+                if is_new:
+                    files_added += 1
+                    logger.debug(f"Added file: {rel_path}")
+                else:
+                    files_updated += 1
+                    logger.debug(f"Updated file: {rel_path}")
+            manifest.save()
+
+        logger.info(f"Differential update completed. Files compared: {len(targets)}, Updated: {files_updated}, Added: {files_added}")
+
+        if files_updated > 0 or files_added > 0:
+            return True, f"Differential update completed successfully. {files_updated} files updated, {files_added} files added.", local_save_path
+        else:
+            return True, "No file changes detected. All files are already up to date.", local_save_path
+
     except Exception as e:
         logger.error(f"An error occurred during differential update: {e}")
         logger.debug(traceback.format_exc())
         return False, f"An error occurred during differential update: {e}", local_save_path
 
-def perform_update(repo_url, folder_path, local_save_path, category, branch=None):
-    """Main update function that chooses between overwrite and differential update methods.
+def perform_update(repo_url, folder_path, local_save_path, category, branch=None, current_sha=None, target_sha=None,
+                   archive_sha=None, retention=None):
+    """Main update function that chooses between overwrite, differential and incremental update methods.
     
     Args:
         repo_url (str): The URL of the GitHub repository
@@ -981,26 +1923,53 @@ def perform_update(repo_url, folder_path, local_save_path, category, branch=None
         local_save_path (str): The local directory where files should be updated
         category (str): The category of the script (Programs, Activities, etc.)
         branch (str): The branch to download from (defaults to main/master)
+        current_sha (str): Commit the local copy was installed from (used by 'incremental')
+        target_sha (str): Commit being updated to (used by 'incremental' and 'differential')
+        archive_sha (str): If given, the current version is archived under this SHA first. An
+            overwrite of a script folder archives the replaced tree after the swap instead.
+        retention (dict): The script's own retention policy keys; after an archiving
+            update, old versions are pruned in the background
         
     Returns:
         tuple: (bool, str, str) indicating (success_status, message, final_script_path)
     """
     try:
         update_method = config_manager.get_update_method()
-        if _get_multi_folder_prefix(repo_url) is not None:
-            update_method = 'overwrite'  # differential can't reconcile renamed subdirs
         logger.info(f"Using update method: {update_method}")
 
-        if update_method == 'differential':
-            return differential_update_from_github(repo_url, folder_path, local_save_path, branch)
+        snapshot_sha = None
+        if archive_sha and os.path.isdir(local_save_path):
+            if update_method == 'overwrite' and category != "Programs":
+                snapshot_sha = archive_sha
+            elif not archive_current_version(local_save_path, archive_sha):
+                logger.warning(f"Failed to archive current version of {local_save_path} before update")
+
+        if update_method == 'incremental':
+            result = None
+            if current_sha and target_sha and category != "Programs" and os.path.isdir(local_save_path):
+                try:
+                    result = _compare_incremental_update(repo_url, folder_path, local_save_path, current_sha, target_sha, branch)
+                except (requests.exceptions.RequestException, IOError) as e:
+                    logger.warning(f"Incremental update failed ({e}); doing a full download.")
+            if result is None:
+                result = download_from_github(repo_url, folder_path, local_save_path, category, branch)
+        elif update_method == 'differential':
+            result = differential_update_from_github(repo_url, folder_path, local_save_path, branch, target_sha)
         else:
             # Default to overwrite method (original behavior)
-            return download_from_github(repo_url, folder_path, local_save_path, category, branch)
+            result = download_from_github(repo_url, folder_path, local_save_path, category, branch, snapshot_sha)
     
     except Exception as e:
         logger.error(f"Error in perform_update: {e}")
         # Fallback to original method in case of any configuration issues
-        return download_from_github(repo_url, folder_path, local_save_path, category, branch)
+        result = download_from_github(repo_url, folder_path, local_save_path, category, branch)
+
+    # Multi-folder repos install into a shared parent dir, which has no per-script manifest
+    if result[0] and result[2] and _get_multi_folder_prefix(repo_url) is None:
+        file_manifest.update_manifest(result[2])
+    if result[0] and archive_sha:
+        prune_versions_in_background(local_save_path, retention)
+    return result
 
 if __name__ == '__main__':
     # Example Usage (for testing)
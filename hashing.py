@@ -0,0 +1,142 @@
+import os
+import mmap
+import zlib
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from logger_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Buffer size for streamed reads; hashlib releases the GIL on buffers over 2 KB.
+READ_SIZE = 1024 * 1024
+# Files at least this large are hashed through mmap instead of read() calls.
+MMAP_THRESHOLD = 8 * 1024 * 1024
+
+ALGORITHMS = ('sha256', 'blake2b', 'git', 'crc32')
+
+
+class _Crc32:
+    """hashlib-style wrapper around zlib.crc32, as stored in zip central directories."""
+
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self):
+        return f"{self._crc:08x}"
+
+
+def _new_hasher(algo, size):
+    if algo == 'git':
+        return hashlib.sha1(b"blob %d\0" % size)
+    if algo == 'crc32':
+        return _Crc32()
+    if algo in ('sha256', 'blake2b'):
+        return hashlib.new(algo)
+    raise ValueError(f"Unsupported hash algorithm: {algo}")
+
+def hash_file(file_path, algo='sha256', read_size=READ_SIZE):
+    """Hashes one file.
+
+    Args:
+        algo (str): 'sha256' (compatibility), 'blake2b' (local-only comparisons;
+            faster than sha256 on CPUs without SHA extensions), 'git' (git blob
+            SHA-1, matches remote tree SHAs) or 'crc32' (matches zip entries).
+        read_size (int): Buffer size for streamed reads.
+
+    Returns:
+        str: The hex digest.
+
+    Raises:
+        OSError: If the file can't be read.
+        ValueError: For an unknown algorithm.
+    """
+    size = os.path.getsize(file_path)
+    hasher = _new_hasher(algo, size)
+    with open(file_path, 'rb') as f:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+        else:
+            buffer = bytearray(min(read_size, max(size, 1)))
+            view = memoryview(buffer)
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                hasher.update(view[:count])
+    return hasher.hexdigest()
+
+def hash_files(file_paths, algo='sha256', max_workers=None):
+    """Hashes a batch of files concurrently on a thread pool.
+
+    Returns:
+        dict: {file_path: hex digest, or None if the file couldn't be read}
+    """
+    def safe_hash(file_path):
+        try:
+            return hash_file(file_path, algo)
+        except OSError as e:
+            logger.error(f"Error hashing {file_path}: {e}")
+            return None
+
+    file_paths = list(file_paths)
+    if len(file_paths) <= 1:
+        return {file_path: safe_hash(file_path) for file_path in file_paths}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(file_paths, executor.map(safe_hash, file_paths)))
+
+
+def _benchmark(file_count=400, small_size=16 * 1024, large_count=4, large_size=32 * 1024 * 1024):
+    """Times the old serial 4 KB SHA-256 loop against every algorithm, serial and parallel, on a synthetic tree."""
+    import time
+    import tempfile
+    import shutil
+
+    def legacy_sha256(path):
+        # What calculate_sha256 used to do: one thread, 4 KB reads.
+        sha256_hash = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(4096), b""):
+                sha256_hash.update(chunk)
+        return sha256_hash.hexdigest()
+
+    root = tempfile.mkdtemp(prefix='hash-bench-')
+    try:
+        paths = []
+        for i in range(file_count):
+            path = os.path.join(root, f"dir{i % 20}", f"file{i}.lua")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(os.urandom(small_size))
+            paths.append(path)
+        for i in range(large_count):
+            path = os.path.join(root, f"large{i}.bin")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(large_size))
+            paths.append(path)
+        total_mb = (file_count * small_size + large_count * large_size) / (1024 * 1024)
+        print(f"Synthetic tree: {len(paths)} files, {total_mb:.0f} MB")
+
+        started = time.perf_counter()
+        for path in paths:
+            legacy_sha256(path)
+        baseline = time.perf_counter() - started
+        print(f"{'baseline':10} sha256, serial, 4 KB reads: {baseline:6.3f}s ({total_mb / baseline:7.1f} MB/s)")
+
+        for algo in ALGORITHMS:
+            started = time.perf_counter()
+            for path in paths:
+                hash_file(path, algo)
+            serial = time.perf_counter() - started
+            started = time.perf_counter()
+            hash_files(paths, algo)
+            parallel = time.perf_counter() - started
+            print(f"{algo:10} serial: {serial:6.3f}s   parallel: {parallel:6.3f}s ({total_mb / parallel:7.1f} MB/s)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+from logger_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Response headers worth keeping alongside a cached body.
+_STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class ResponseCache:
+    """Persistent on-disk cache of GET responses, keyed by URL.
+
+    Each entry keeps the body plus its ETag / Last-Modified validators so the
+    next request for the same URL can be made conditional. GitHub answers an
+    unchanged resource with a body-less 304 that does not count against the
+    rate limit; the cached body is then served in its place.
+
+    Entries live one file per URL under cache_dir and are mirrored in memory,
+    so lookups only touch the disk once per URL per session.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def lookup(self, url):
+        """Returns the cached entry for url, or None."""
+        with self._lock:
+            if url in self._entries:
+                return self._entries[url]
+        entry = None
+        path = self._entry_path(url)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                if entry.get('url') != url:
+                    entry = None
+            except (json.JSONDecodeError, IOError) as e:
+                logger.debug(f"Ignoring unreadable cache entry {path}: {e}")
+                entry = None
+        with self._lock:
+            self._entries[url] = entry
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Builds If-None-Match / If-Modified-Since headers for a cached entry."""
+        headers = {}
+        if not entry:
+            return headers
+        stored = entry.get('headers', {})
+        if stored.get('ETag'):
+            headers['If-None-Match'] = stored['ETag']
+        if stored.get('Last-Modified'):
+            headers['If-Modified-Since'] = stored['Last-Modified']
+        return headers
+
+    def store(self, url, response):
+        """Caches a 200 response if it carries a validator."""
+        stored = {name: response.headers[name] for name in _STORED_HEADERS if name in response.headers}
+        if 'ETag' not in stored and 'Last-Modified' not in stored:
+            return
+        entry = {'url': url, 'headers': stored, 'body': response.content.decode('utf-8', errors='replace')}
+        with self._lock:
+            self._entries[url] = entry
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._entry_path(url)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+        except (IOError, OSError) as e:
+            logger.debug(f"Could not persist cache entry for {url}: {e}")
+
+    @staticmethod
+    def build_response(entry, not_modified):
+        """Turns a 304 into a 200 response carrying the cached body.
+
+        Headers from the live 304 (e.g. rate-limit counters) win over the stored ones.
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry.get('headers', {}))
+        response.headers.update(not_modified.headers)
+        response.headers.pop('Content-Length', None)
+        response._content = entry['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.request = not_modified.request
+        response.from_cache = True
+        return response
+
+    def clear(self):
+        """Removes every cached entry from memory and disk."""
+        with self._lock:
+            self._entries.clear()
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
@@ -0,0 +1,153 @@
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import config_manager
+from http_cache import ResponseCache
+import rate_limiter
+from logger_setup import get_logger
+
+logger = get_logger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+class GitHubClient:
+    """Shared HTTP client for all GitHub traffic.
+
+    Wraps a single requests.Session whose adapters keep a pool of keep-alive
+    connections per host, so repeated calls to api.github.com / codeload reuse
+    the same TLS connection instead of handshaking every time. urllib3's
+    connection pool is thread-safe, so one client can serve every worker thread.
+
+    The GitHub API headers (including the token) are built once and cached;
+    call invalidate_headers() after the token changes (this also empties the
+    response cache).
+
+    At most max_per_host requests are in flight to any one host at a time, so
+    a burst of parallel checks queues politely instead of hammering the API.
+
+    GETs made with use_cache=True are sent conditionally against the
+    on-disk ResponseCache and a 304 is answered from the cached body.
+
+    Every request passes through the rate_limiter scheduler, which sees the
+    X-RateLimit-* headers of each response and may hold back or refuse a
+    request (RateLimitExceeded, a RequestException) when the budget is spent.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, cache_dir=None, max_per_host=6):
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._headers = None
+        self._headers_lock = threading.Lock()
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.max_per_host = max_per_host
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        logger.debug(f"HTTP client created (pool_connections={pool_connections}, pool_maxsize={pool_maxsize}, max_per_host={max_per_host})")
+
+    def get_headers(self):
+        """Returns a copy of the cached GitHub API headers, building them on first use."""
+        with self._headers_lock:
+            if self._headers is None:
+                headers = {
+                    'Accept': 'application/vnd.github.v3+json',
+                    'User-Agent': USER_AGENT
+                }
+                token = config_manager.get_github_token()
+                if token:
+                    headers['Authorization'] = f'token {token}'
+                    logger.debug("Using GitHub token authentication")
+                else:
+                    logger.debug("Using unauthenticated GitHub API requests")
+                self._headers = headers
+            return dict(self._headers)
+
+    def invalidate_headers(self):
+        """Drops the cached headers so the next request re-reads the token.
+
+        The response cache is cleared too: GitHub varies responses on
+        Authorization, so entries fetched under the old token don't apply.
+        """
+        with self._headers_lock:
+            self._headers = None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _host_slot(self, url):
+        """Returns the semaphore bounding concurrent requests to url's host."""
+        host = urlsplit(url).netloc.lower()
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_host)
+                self._host_slots[host] = slot
+            return slot
+
+    def request(self, method, url, github_headers=True, headers=None, use_cache=False, **kwargs):
+        """Sends a request through the pooled session.
+
+        Args:
+            github_headers (bool): Attach the cached GitHub API headers (Accept, token).
+                Pass False for plain asset downloads that never needed them.
+            headers (dict): Extra headers merged on top.
+            use_cache (bool): Make a GET conditional on the cached ETag/Last-Modified
+                and serve a 304 from the cache. Ignored for streamed requests.
+        """
+        merged = self.get_headers() if github_headers else {}
+        if headers:
+            merged.update(headers)
+
+        use_cache = use_cache and self.cache is not None and method == 'GET' and not kwargs.get('stream')
+        entry = None
+        if use_cache:
+            entry = self.cache.lookup(url)
+            merged.update(ResponseCache.conditional_headers(entry))
+
+        scheduler = rate_limiter.get_scheduler()
+        with scheduler.slot(url) as resource:
+            with self._host_slot(url):
+                response = self._session.request(method, url, headers=merged, **kwargs)
+            # Inside the slot, so the budget is updated before the request stops counting as in flight
+            scheduler.observe(resource, response)
+
+        if use_cache:
+            if response.status_code == 304 and entry:
+                logger.debug(f"Not modified, served from cache: {url}")
+                return ResponseCache.build_response(entry, response)
+            if response.status_code == 200:
+                self.cache.store(url, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self._session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Returns the process-wide GitHubClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            pool = config_manager.get_http_pool_settings()
+            _client = GitHubClient(pool['connections'], pool['maxsize'],
+                                   cache_dir=config_manager.HTTP_CACHE_DIR, max_per_host=pool['per_host'])
+        return _client
+
+def get(url, **kwargs):
+    """Shortcut for get_client().get(...)."""
+    return get_client().get(url, **kwargs)
+
+def post(url, **kwargs):
+    """Shortcut for get_client().post(...)."""
+    return get_client().post(url, **kwargs)
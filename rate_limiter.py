@@ -0,0 +1,189 @@
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from logger_setup import get_logger
+
+logger = get_logger(__name__)
+
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+
+# Longest pause inserted between background requests when the budget runs low.
+MAX_BACKGROUND_PACE = 2.0
+
+_thread_state = threading.local()
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Raised instead of sending a request that GitHub would certainly reject."""
+
+    def __init__(self, message, reset_at=None):
+        super().__init__(message)
+        self.reset_at = reset_at
+
+
+class RateLimitDeferred(RateLimitExceeded):
+    """Raised for background requests held back to save budget for user-initiated work."""
+
+
+def get_resource(url):
+    """Returns the GitHub rate-limit bucket a URL counts against, or None if untracked."""
+    parts = urlsplit(url)
+    if parts.netloc.lower() != 'api.github.com':
+        return None
+    return 'graphql' if parts.path.startswith('/graphql') else 'core'
+
+@contextmanager
+def background_priority():
+    """Marks requests made by the current thread as background work."""
+    previous = getattr(_thread_state, 'priority', PRIORITY_USER)
+    _thread_state.priority = PRIORITY_BACKGROUND
+    try:
+        yield
+    finally:
+        _thread_state.priority = previous
+
+def current_priority():
+    return getattr(_thread_state, 'priority', PRIORITY_USER)
+
+
+class RateLimitScheduler:
+    """Tracks GitHub's rate-limit budget from response headers and gates requests.
+
+    - User-initiated requests (the default) always go first: background requests
+      wait while any user request is in flight.
+    - Background requests are deferred (RateLimitDeferred) once the remaining
+      budget drops to the reserve kept for user work, and are paced out as the
+      budget approaches it.
+    - Any request is refused (RateLimitExceeded) when the budget is exhausted
+      and the reset time has not passed yet, instead of burning a certain 403.
+      A user request that only finds the budget held by requests in flight
+      waits for their answers instead.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # resource -> {'limit', 'remaining', 'reset'}, as last reported by GitHub
+        self._in_flight = {}  # resource -> requests sent but not answered yet
+        self._user_in_flight = 0
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _reserve(limit):
+        return max(5, limit // 10)
+
+    def _bucket(self, resource):
+        # Caller holds the lock. Returns the bucket, or None if unknown or its window has reset.
+        bucket = self._buckets.get(resource)
+        if bucket and bucket['reset'] <= time.time():
+            del self._buckets[resource]
+            return None
+        return bucket
+
+    def _available(self, resource, bucket):
+        # Caller holds the lock. Budget left once the requests still in flight are answered.
+        return bucket['remaining'] - self._in_flight.get(resource, 0)
+
+    def reset(self):
+        """Forgets the budgets seen so far, e.g. after the token changed and with it the limits."""
+        with self._cond:
+            self._buckets.clear()
+            self._cond.notify_all()
+
+    def deferred_until(self, resource='core'):
+        """Returns the reset timestamp if background work on resource is currently deferred, else None."""
+        with self._cond:
+            bucket = self._bucket(resource)
+            if bucket and self._available(resource, bucket) <= self._reserve(bucket['limit']):
+                return bucket['reset']
+        return None
+
+    def acquire(self, resource, priority):
+        """Blocks until a request may be sent; raises RateLimitExceeded/RateLimitDeferred otherwise."""
+        pace = 0
+        with self._cond:
+            if priority == PRIORITY_BACKGROUND:
+                while self._user_in_flight > 0:
+                    self._cond.wait()
+            bucket = self._bucket(resource) if resource else None
+            if priority == PRIORITY_USER:
+                # Budget held by requests in flight may come back (conditional 304s are free),
+                # so a user request waits for their answers and fails only on an empty budget
+                while bucket and bucket['remaining'] > 0 and self._available(resource, bucket) <= 0:
+                    self._cond.wait(bucket['reset'] - time.time())
+                    bucket = self._bucket(resource)
+            if bucket:
+                available = self._available(resource, bucket)
+                reset_clock = time.strftime('%H:%M', time.localtime(bucket['reset']))
+                if available <= 0:
+                    raise RateLimitExceeded(f"GitHub API rate limit exhausted; resets at {reset_clock}.", bucket['reset'])
+                reserve = self._reserve(bucket['limit'])
+                if priority == PRIORITY_BACKGROUND:
+                    if available <= reserve:
+                        raise RateLimitDeferred(f"Background check deferred until {reset_clock} to save API budget.", bucket['reset'])
+                    if available <= reserve * 3:
+                        spare = available - reserve
+                        pace = min(MAX_BACKGROUND_PACE, (bucket['reset'] - time.time()) / spare)
+            if resource:
+                self._in_flight[resource] = self._in_flight.get(resource, 0) + 1
+            if priority == PRIORITY_USER:
+                self._user_in_flight += 1
+        if pace > 0:
+            time.sleep(pace)
+
+    def release(self, resource, priority):
+        with self._cond:
+            if resource:
+                self._in_flight[resource] -= 1
+            if priority == PRIORITY_USER:
+                self._user_in_flight -= 1
+            self._cond.notify_all()
+
+    def observe(self, resource, response):
+        """Updates the budget from a response's X-RateLimit-* headers.
+
+        The header value is taken as is (in-flight requests are tracked
+        separately), so free responses such as conditional 304s cost nothing.
+        """
+        headers = response.headers
+        resource = headers.get('X-RateLimit-Resource', resource)
+        if not resource or 'X-RateLimit-Remaining' not in headers:
+            return
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            limit = int(headers.get('X-RateLimit-Limit', remaining))
+            reset = float(headers.get('X-RateLimit-Reset', time.time() + 3600))
+        except ValueError:
+            return
+        with self._cond:
+            bucket = self._buckets.get(resource)
+            if bucket and bucket['reset'] == reset:
+                # Responses from parallel requests arrive out of order; GitHub's count only
+                # falls within a window, so the lowest reported value is the current one.
+                bucket['remaining'] = min(bucket['remaining'], remaining)
+                bucket['limit'] = limit
+            else:
+                self._buckets[resource] = {'limit': limit, 'remaining': remaining, 'reset': reset}
+            self._cond.notify_all()
+        if remaining <= self._reserve(limit):
+            logger.warning(f"GitHub '{resource}' rate limit low: {remaining}/{limit} left until "
+                           f"{time.strftime('%H:%M', time.localtime(reset))}")
+
+    @contextmanager
+    def slot(self, url):
+        """Wraps one request: acquire before sending, release afterwards."""
+        resource = get_resource(url)
+        priority = current_priority()
+        self.acquire(resource, priority)
+        try:
+            yield resource
+        finally:
+            self.release(resource, priority)
+
+
+_scheduler = RateLimitScheduler()
+
+def get_scheduler():
+    """Returns the process-wide RateLimitScheduler."""
+    return _scheduler
@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import threading
+import config_manager
+from logger_setup import get_logger
+
+logger = get_logger(__name__)
+
+
+class RepoMetadataCache:
+    """Repository metadata (default branch, repo id, pushed_at) keyed by owner/repo.
+
+    Held in memory and persisted to a JSON file so the default branch of a repo
+    is looked up once and then reused by adds, updates and checks until the
+    entry is older than ttl seconds.
+    """
+
+    def __init__(self, cache_file, ttl):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user, repo_name):
+        return f"{user}/{repo_name}".lower()
+
+    def _load(self):
+        # Caller holds the lock.
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    self._entries = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logger.debug(f"Ignoring unreadable repo metadata cache {self.cache_file}: {e}")
+
+    def _save(self):
+        # Caller holds the lock.
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            temp_path = self.cache_file + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self._entries, f, indent=4)
+            os.replace(temp_path, self.cache_file)
+        except (IOError, OSError) as e:
+            logger.debug(f"Could not persist repo metadata cache: {e}")
+
+    def get(self, user, repo_name):
+        """Returns the cached metadata dict, or None if missing or expired."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(self._key(user, repo_name))
+        if entry and time.time() - entry.get('fetched_at', 0) < self.ttl:
+            return entry
+        return None
+
+    def put(self, user, repo_name, default_branch=None, repo_id=None, pushed_at=None):
+        """Stores metadata for a repo; fields passed as None keep their previous value."""
+        key = self._key(user, repo_name)
+        with self._lock:
+            self._load()
+            entry = dict(self._entries.get(key, {}))
+            for field, value in (('default_branch', default_branch), ('id', repo_id), ('pushed_at', pushed_at)):
+                if value is not None:
+                    entry[field] = value
+            entry['fetched_at'] = time.time()
+            self._entries[key] = entry
+            self._save()
+        return entry
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_repo_cache():
+    """Returns the process-wide RepoMetadataCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RepoMetadataCache(config_manager.REPO_METADATA_FILE, config_manager.get_repo_metadata_ttl())
+        return _cache
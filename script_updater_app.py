@@ -6,6 +6,7 @@ import os
 import queue
 import webbrowser
 import shutil
+import time
 
 # Helper function for PyInstaller
 def resource_path(relative_path):
@@ -36,10 +37,11 @@ ctk.set_default_color_theme("blue")  # Themes: "blue" (standard), "green", "dark
 class AppUpdateDialog(ctk.CTkToplevel):
     """Modal dialog shown when a new app version is available."""
 
-    def __init__(self, parent, new_version, release_notes, download_url):
+    def __init__(self, parent, new_version, release_notes, download_url, download_size=None):
         super().__init__(parent)
         self._parent = parent
         self._download_url = download_url
+        self._download_size = download_size
         self._new_version = new_version
         self._new_exe_path = None
 
@@ -113,6 +115,7 @@ class AppUpdateDialog(ctk.CTkToplevel):
                 self._download_url,
                 self._new_exe_path,
                 lambda done, total: self.after(0, self._update_progress, done, total),
+                expected_size=self._download_size,
             )
             self.after(0, self._on_download_complete)
         except Exception as e:
@@ -191,6 +194,7 @@ class ScriptUpdaterApp(ctk.CTk):
 
         # Clean up after update
         self.cleanup_after_update()
+        self.cleanup_stale_install_dirs()
 
         # --- Input Frame ---
         self.input_frame = ctk.CTkFrame(self.main_frame)
@@ -277,7 +281,7 @@ class ScriptUpdaterApp(ctk.CTk):
         
         self.update_method_menu = ctk.CTkOptionMenu(
             self.search_frame, 
-            values=["overwrite", "differential"], 
+            values=["overwrite", "differential", "incremental"], 
             variable=self.update_method_var,
             command=self.on_update_method_changed,
             width=120
@@ -355,15 +359,11 @@ class ScriptUpdaterApp(ctk.CTk):
         self.update_queue = queue.Queue()
 
         self.refresh_scripts_display() # Initial display before check
+        self.recheck_scheduled = False
 
         # Start the startup check in a separate thread to keep UI responsive
         self.status_bar.configure(text="Checking all scripts for updates on startup...")
-        thread = threading.Thread(
-            target=self.perform_startup_update_check_worker, 
-            args=(self.scripts_data.copy(), self.update_queue), # Pass a copy to avoid race conditions
-            daemon=True
-        )
-        thread.start()
+        self.start_update_check()
 
         # Start polling the queue for updates from the worker thread
         self.process_queue()
@@ -371,6 +371,16 @@ class ScriptUpdaterApp(ctk.CTk):
         # Start the app update check
         self.after(1000, self.start_app_update_check)
 
+    def start_update_check(self):
+        """Runs the background update check for all scripts in a worker thread."""
+        self.recheck_scheduled = False
+        thread = threading.Thread(
+            target=self.perform_startup_update_check_worker,
+            args=(self.scripts_data.copy(), self.update_queue), # Pass a copy to avoid race conditions
+            daemon=True
+        )
+        thread.start()
+
     def cleanup_after_update(self):
         """Deletes the old executable after an update."""
         if not hasattr(sys, 'frozen'):
@@ -385,6 +395,19 @@ class ScriptUpdaterApp(ctk.CTk):
             except OSError as e:
                 logger.error(f"Failed to remove old executable: {e}")
 
+    def cleanup_stale_install_dirs(self):
+        """Removes staging dirs and replaced script trees left behind by an earlier run."""
+        directories = []
+        for script_data in self.scripts_data:
+            local_path = script_data.get('local_path')
+            if not local_path:
+                continue
+            directories.append(os.path.dirname(os.path.abspath(local_path)))
+            if github_handler.is_multi_folder_repo(script_data.get('repo_url', '')):
+                # Multi-folder subfolders are staged inside the shared folder itself
+                directories.append(local_path)
+        threading.Thread(target=github_handler.cleanup_stale_install_dirs, args=(directories,), daemon=True).start()
+
     def start_app_update_check(self):
         """Starts the application update check in a separate thread."""
         self.status_bar.configure(text="Checking for app updates...")
@@ -393,9 +416,9 @@ class ScriptUpdaterApp(ctk.CTk):
     def check_and_prompt_for_update(self):
         """Runs on a background thread; schedules the update dialog on the main thread if needed."""
         logger.info("Checking for application updates...")
-        new_version, download_url, release_notes, status = github_handler.check_for_app_update(APP_VERSION)
+        new_version, download_url, download_size, release_notes, status = github_handler.check_for_app_update(APP_VERSION)
         if status == "update_available":
-            self.after(0, self._show_update_dialog, new_version, download_url, release_notes)
+            self.after(0, self._show_update_dialog, new_version, download_url, release_notes, download_size)
         elif status == "prerelease":
             self.after(0, self.status_bar.configure,
                        {"text": "Latest release is a pre-release — no update applied."})
@@ -408,9 +431,9 @@ class ScriptUpdaterApp(ctk.CTk):
         else:
             self.after(0, self.status_bar.configure, {"text": "Ready"})
 
-    def _show_update_dialog(self, new_version, download_url, release_notes):
+    def _show_update_dialog(self, new_version, download_url, release_notes, download_size=None):
         self.status_bar.configure(text=f"New version {new_version} available!")
-        AppUpdateDialog(self, new_version, release_notes, download_url)
+        AppUpdateDialog(self, new_version, release_notes, download_url, download_size)
 
     def _get_author_from_url(self, repo_url):
         if not repo_url or not isinstance(repo_url, str):
@@ -680,22 +703,24 @@ class ScriptUpdaterApp(ctk.CTk):
                     self.status_bar.configure(text=f"Update available for {script_name}. Downloading...")
                     self.update_idletasks()
                     
-                    # Archive current version before updating (skipped for multi-folder repos
+                    # Archive current version as part of the update (skipped for multi-folder repos
                     # because local_path is the parent scripts dir — archiving it would snapshot
                     # the entire folder, not just this script's content).
                     is_mf = github_handler.is_multi_folder_repo(script_data_ref['repo_url'])
+                    current_sha_for_archive = None
                     if not is_mf:
                         current_sha_for_archive = current_local_sha if current_local_sha else "unknown"
-                        archive_success = github_handler.archive_current_version(script_data_ref['local_path'], current_sha_for_archive)
-                        if not archive_success:
-                            logger.warning(f"Failed to archive current version of {script_name} before update")
 
                     download_success, message, final_script_path = github_handler.perform_update(
                         script_data_ref['repo_url'],
                         script_data_ref['folder_path'],
                         script_data_ref['local_path'],
                         script_data_ref['category'],
-                        branch=None
+                        branch=None,
+                        current_sha=current_local_sha,
+                        target_sha=latest_remote_sha,
+                        archive_sha=current_sha_for_archive,
+                        retention=script_data_ref.get('retention')
                     )
 
                     if download_success:
@@ -753,6 +778,10 @@ class ScriptUpdaterApp(ctk.CTk):
         pass
 
     def refresh_scripts_display(self, filter_text=""):
+        # Remember checked scripts so a redraw (e.g. streamed check results) keeps the selection
+        selected_ids = {id(item['script_data']) for item in self.script_widgets
+                        if item.get('checkbox_var') and item['checkbox_var'].get() == 1}
+
         # Clear existing widgets from all tab frames
         for tab_name, scrollable_frame in self.managed_tab_scrollable_frames.items():
             for widget in scrollable_frame.winfo_children():
@@ -776,6 +805,7 @@ class ScriptUpdaterApp(ctk.CTk):
         status_order = {
             'available': 0,
             'check_failed': 1,
+            'deferred': 1,
             'uptodate': 2,
             'Up to date': 2, # To handle older status values if any
             'Unknown (fetch error)': 3,
@@ -806,7 +836,7 @@ class ScriptUpdaterApp(ctk.CTk):
         scripts_added_to_category_tabs = {cat: False for cat in self.managed_script_categories if cat != "All"}
 
         for script_data_item in filtered_scripts: # Iterate over the filtered list
-            checkbox_var = ctk.IntVar(value=0) # Default to unchecked
+            checkbox_var = ctk.IntVar(value=1 if id(script_data_item) in selected_ids else 0)
 
             self.script_widgets.append({
                 'checkbox_var': checkbox_var,
@@ -853,6 +883,8 @@ class ScriptUpdaterApp(ctk.CTk):
             status_text = "✅ Up to date"
         elif status_indicator == 'check_failed':
             status_text = "⚠️ Check Failed"
+        elif status_indicator == 'deferred':
+            status_text = "⏳ Check Deferred (rate limit)"
         elif status_indicator == 'folders_missing':
             status_text = "📂 Folder(s) Missing"
         else: # Fallback logic if update_status_indicator is not one of the expected values
@@ -957,23 +989,44 @@ class ScriptUpdaterApp(ctk.CTk):
     def process_queue(self):
         """Processes messages from the worker thread queue to update the UI."""
         try:
-            message = self.update_queue.get_nowait()
-            if isinstance(message, list): # Expected: list of script_data dicts
-                print("[INFO] Received updated script data from worker thread.")
-                self.scripts_data = message
-                config_manager.save_scripts_config(self.scripts_data) # Persist the new statuses
-                self.refresh_scripts_display()
-                self.status_bar.configure(text="Startup update check complete.")
-                print("[INFO] UI updated and startup check complete.")
-            elif isinstance(message, str): # For simple status messages or errors from worker
-                self.status_bar.configure(text=message)
-                print(f"[INFO] Worker thread message: {message}")
-            # Add handling for other message types if necessary
+            scripts_checked = False
+            while True:
+                message = self.update_queue.get_nowait()
+                if isinstance(message, list): # Expected: list of script_data dicts
+                    print("[INFO] Received updated script data from worker thread.")
+                    self.scripts_data = message
+                    config_manager.save_scripts_config(self.scripts_data) # Persist the new statuses
+                    self.refresh_scripts_display(filter_text=self.search_entry.get().lower().strip())
+                    scripts_checked = False
+                    if not self.recheck_scheduled:
+                        self.status_bar.configure(text="Startup update check complete.")
+                    print("[INFO] UI updated and startup check complete.")
+                elif isinstance(message, tuple) and message[0] == 'script_checked':
+                    # Per-script result; the dict is shared with self.scripts_data and already updated
+                    _, _, checked, total = message
+                    scripts_checked = True
+                    self.status_bar.configure(text=f"Checking scripts for updates... {checked}/{total}")
+                elif isinstance(message, tuple) and message[0] == 'recheck_at':
+                    # Background check ran out of API budget; retry once the limit resets
+                    reset_at = message[1]
+                    if not self.recheck_scheduled:
+                        self.recheck_scheduled = True
+                        delay_ms = max(0, int((reset_at - time.time()) * 1000)) + 5000
+                        self.after(delay_ms, self.start_update_check)
+                    reset_clock = datetime.datetime.fromtimestamp(reset_at).strftime('%H:%M')
+                    self.status_bar.configure(text=f"API rate limit low — remaining checks deferred until {reset_clock}.")
+                elif isinstance(message, str): # For simple status messages or errors from worker
+                    self.status_bar.configure(text=message)
+                    print(f"[INFO] Worker thread message: {message}")
+                # Add handling for other message types if necessary
         except queue.Empty:
             pass # No message in queue, continue polling
         except Exception as e:
             print(f"[ERROR] Error processing queue: {e}")
         finally:
+            # Redraw once per batch of streamed results rather than once per script
+            if scripts_checked:
+                self.refresh_scripts_display(filter_text=self.search_entry.get().lower().strip())
             # Check again after 100ms
             self.after(100, self.process_queue)
 
@@ -987,6 +1040,7 @@ class ScriptUpdaterApp(ctk.CTk):
         
         missing_scripts = []
         scripts_to_check = list(scripts_data)  # iterate over copy to allow removal
+        scripts_needing_sha = []
 
         for script_data in scripts_to_check:
             script_name = script_data.get('name', 'Unknown Script')
@@ -1014,23 +1068,40 @@ class ScriptUpdaterApp(ctk.CTk):
                     script_data['current_version_sha'] = ''  # forces re-download on next Update click
                     continue
 
-            try:
-                latest_remote_sha = github_handler.get_latest_commit_sha(script_data.get('repo_url'))
-                current_local_sha = script_data.get('current_version_sha')
-                script_data['last_checked'] = datetime.datetime.now().isoformat()
-
-                if latest_remote_sha:
-                    if current_local_sha is None:
-                        script_data['update_status_indicator'] = 'available'
-                    elif latest_remote_sha != current_local_sha:
-                        script_data['update_status_indicator'] = 'available'
-                    else:
-                        script_data['update_status_indicator'] = 'uptodate'
-                else:
-                    script_data['update_status_indicator'] = 'check_failed'
-            except Exception as e:
-                script_data['update_status_indicator'] = 'check_failed'
-                print(f"[ERROR] Worker thread: An unexpected error occurred while checking {script_name}: {e}")
+            scripts_needing_sha.append(script_data)
+
+        # Resolve repo heads (batched GraphQL when a token is set, parallel REST otherwise)
+        # and stream each script's result to the UI as soon as its repo is answered.
+        scripts_by_repo = {}
+        for script_data in scripts_needing_sha:
+            scripts_by_repo.setdefault(script_data.get('repo_url'), []).append(script_data)
+
+        total = len(scripts_needing_sha)
+        checked = 0
+        deferred_until = None
+        try:
+            # Background priority: yields to user-initiated requests and is deferred
+            # (instead of failing) once the API rate-limit budget runs low.
+            for repo_url, latest_remote_sha in github_handler.iter_latest_commit_shas(scripts_needing_sha, background=True):
+                # Decided per result: a failure outside a deferral is still reported as a failure
+                deferred = None if latest_remote_sha else github_handler.background_check_deferred_until()
+                deferred_until = deferred or deferred_until
+                for script_data in scripts_by_repo.pop(repo_url, []):
+                    ScriptUpdaterApp.apply_check_result(script_data, latest_remote_sha, deferred=bool(deferred))
+                    checked += 1
+                    q.put(('script_checked', script_data, checked, total))
+        except Exception as e:
+            print(f"[ERROR] Worker thread: An unexpected error occurred during the update check: {e}")
+
+        # Anything the check never answered (bad URL, crash) is reported as failed
+        for remaining in scripts_by_repo.values():
+            for script_data in remaining:
+                ScriptUpdaterApp.apply_check_result(script_data, None)
+                checked += 1
+                q.put(('script_checked', script_data, checked, total))
+
+        if deferred_until:
+            q.put(('recheck_at', deferred_until))
 
         # Persist updated list (missing entries removed) as soon as possible
         try:
@@ -1045,6 +1116,27 @@ class ScriptUpdaterApp(ctk.CTk):
         print("[INFO] Worker thread finished. Placing result in queue.")
         q.put(scripts_data)
 
+    @staticmethod
+    def apply_check_result(script_data, latest_remote_sha, deferred=False):
+        """Sets a script's update indicator from the latest remote SHA.
+        A missing SHA means the check failed, or was deferred by the rate limit if deferred is set."""
+        if not latest_remote_sha and deferred:
+            script_data['update_status_indicator'] = 'deferred'
+            return
+
+        current_local_sha = script_data.get('current_version_sha')
+        script_data['last_checked'] = datetime.datetime.now().isoformat()
+
+        if latest_remote_sha:
+            if current_local_sha is None:
+                script_data['update_status_indicator'] = 'available'
+            elif latest_remote_sha != current_local_sha:
+                script_data['update_status_indicator'] = 'available'
+            else:
+                script_data['update_status_indicator'] = 'uptodate'
+        else:
+            script_data['update_status_indicator'] = 'check_failed'
+
     def delete_selected_script(self):
         selected_scripts_data = []
         for item in self.script_widgets:
@@ -1476,6 +1568,7 @@ class ScriptUpdaterApp(ctk.CTk):
         """Save the GitHub personal access token."""
         token = self.entry_github_token.get().strip()
         config_manager.set_github_token(token)
+        github_handler.reset_github_auth()
         
         if token:
             logger.info("GitHub token saved successfully")
@@ -1490,6 +1583,7 @@ class ScriptUpdaterApp(ctk.CTk):
         """Clear the GitHub personal access token."""
         self.entry_github_token.delete(0, tk.END)
         config_manager.set_github_token("")
+        github_handler.reset_github_auth()
         logger.info("GitHub token cleared")
         self.status_bar.configure(text="GitHub token cleared - using unauthenticated API (60/hour)")
         messagebox.showinfo("Token Cleared", "GitHub token cleared.\nUsing unauthenticated API (60 requests/hour).")
@@ -1543,8 +1637,10 @@ GitHub Token (Optional):
 • Click "Save Token" to store it securely in your settings.
 
 Version Management:
-• When you update a script, the old version is automatically saved in an "Older Versions" folder.
+• When you update a script, the old version is automatically archived in its "Older Versions" folder.
+• Files shared between versions are stored only once (in "Older Versions/.store"), so each archive only adds the files that changed. With "archive_format": "pack" in app_settings.json, each version is a single .zip pack instead.
 • Select a single script and click "Manage Versions" to view and restore previous versions.
+• An optional "retention" policy in app_settings.json prunes the oldest versions after updates and restores.
 • The "Older Versions" folder is always preserved during updates regardless of update method."""
 
         # Create a new window for help
@@ -1647,8 +1743,8 @@ Version Management:
             messagebox.showerror("Error", "Script path not found or invalid.")
             return
         
-        # Get available versions
-        available_versions = github_handler.get_available_versions(script_path)
+        # Get available versions (from the version index, with sizes)
+        available_versions = github_handler.get_version_details(script_path)
         
         # Create version management window
         version_window = ctk.CTkToplevel(self)
@@ -1692,7 +1788,8 @@ Version Management:
             
             selected_version = ctk.StringVar()
             
-            for version in available_versions:
+            for entry in available_versions:
+                version = entry['id']
                 version_frame = ctk.CTkFrame(scrollable_frame)
                 version_frame.pack(fill="x", pady=2)
                 
@@ -1702,6 +1799,11 @@ Version Management:
                     display_text = version.replace("_from-github", " (GitHub Update)")
                 elif "_before-restore" in version:
                     display_text = version.replace("_before-restore", " (Before Version Switch)")
+                if entry['bytes'] >= 1024 * 1024:
+                    size_text = f"{entry['bytes'] / (1024 * 1024):.1f} MB"
+                else:
+                    size_text = f"{max(1, entry['bytes'] // 1024)} KB"
+                display_text += f"  -  {entry['files']} files, {size_text}"
                 
                 radio_button = ctk.CTkRadioButton(version_frame, text=display_text, 
                                                 variable=selected_version, value=version)
@@ -1721,7 +1823,8 @@ Version Management:
                     
                     # Get current SHA if available
                     current_sha = script_data.get('current_version_sha')
-                    success = github_handler.restore_version(script_path, selected, current_sha)
+                    success = github_handler.restore_version(script_path, selected, current_sha,
+                                                             retention=script_data.get('retention'))
                     if success:
                         messagebox.showinfo("Success", f"Successfully restored version '{selected}'.")
                         self.refresh_scripts_display()  # Refresh the main view
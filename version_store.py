@@ -0,0 +1,693 @@
+import os
+import sys
+import errno
+import json
+import time
+import shutil
+import threading
+import uuid
+import zipfile
+from datetime import datetime
+import config_manager
+import file_manifest
+import hashing
+from logger_setup import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+if sys.platform == 'win32':
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+
+logger = get_logger(__name__)
+
+OLDER_VERSIONS_DIR = "Older Versions"
+# Blob store and version manifests, kept inside "Older Versions".
+STORE_DIR = ".store"
+# Blobs are keyed by git blob SHA-1, the hash the file manifest already caches.
+HASH_ALGO = 'git'
+# Versions archived as packs are single zip files in "Older Versions"; the zip's
+# central directory is the member index, the version's metadata its comment.
+PACK_SUFFIX = '.zip'
+# Deflate level for packs: fastest, most of the gain on text-heavy Lua trees.
+PACK_COMPRESSLEVEL = 1
+# Per-script index of every archived version (id, SHA, date, context, size), in "Older Versions".
+INDEX_FILE = ".index.json"
+# Linux ioctl that makes one file share another's data blocks copy-on-write (btrfs, XFS, ...).
+_FICLONE = 0x40049409
+# Windows counterpart: block cloning between files on one ReFS volume (incl. Dev Drive).
+_FSCTL_DUPLICATE_EXTENTS_TO_FILE = 0x00098344
+_FILE_ATTRIBUTE_SPARSE_FILE = 0x200
+# Block clones are issued in cluster-aligned chunks below the 4 GiB per-call limit.
+_CLONE_CHUNK = 1 << 30
+
+_link_modes = {}  # (st_dev, configured mode) -> detected mode
+_link_modes_lock = threading.Lock()
+_store_locks = {}  # "Older Versions" path -> RLock serialising changes to that script's archive
+_store_locks_lock = threading.Lock()
+
+
+def list_tree(root):
+    """Returns (files, dirs): '/'-separated paths of every file and every empty
+    directory under root, skipping "Older Versions"."""
+    files = []
+    empty_dirs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == root:
+            dirnames[:] = [d for d in dirnames if d != OLDER_VERSIONS_DIR]
+        rel_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        if not dirnames and not filenames and dirpath != root:
+            empty_dirs.append(rel_dir)
+        for filename in filenames:
+            files.append(filename if rel_dir == '.' else f"{rel_dir}/{filename}")
+    return files, empty_dirs
+
+if sys.platform == 'win32':
+    class _DuplicateExtentsData(ctypes.Structure):
+        _fields_ = [('FileHandle', wintypes.HANDLE), ('SourceFileOffset', ctypes.c_longlong),
+                    ('TargetFileOffset', ctypes.c_longlong), ('ByteCount', ctypes.c_longlong)]
+
+def _block_clone(src, dst, src_path):
+    """Clones the open file src into dst with FSCTL_DUPLICATE_EXTENTS_TO_FILE (Windows, ReFS)."""
+    if os.stat(src_path).st_file_attributes & _FILE_ATTRIBUTE_SPARSE_FILE:
+        raise OSError(errno.EOPNOTSUPP, "Sparse files are not block cloned")
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    root = os.path.splitdrive(os.path.abspath(src_path))[0] + '\\'
+    sectors_per_cluster, bytes_per_sector = wintypes.DWORD(), wintypes.DWORD()
+    if not kernel32.GetDiskFreeSpaceW(root, ctypes.byref(sectors_per_cluster), ctypes.byref(bytes_per_sector), None, None):
+        raise ctypes.WinError(ctypes.get_last_error())
+    cluster = sectors_per_cluster.value * bytes_per_sector.value
+    size = os.fstat(src.fileno()).st_size
+    # The target must already have its final size; the last clone may run past EOF up to the cluster boundary
+    dst.truncate(size)
+    data = _DuplicateExtentsData(msvcrt.get_osfhandle(src.fileno()), 0, 0, 0)
+    returned = wintypes.DWORD()
+    aligned_size = -(-size // cluster) * cluster
+    chunk = _CLONE_CHUNK - _CLONE_CHUNK % cluster
+    for offset in range(0, aligned_size, chunk):
+        data.SourceFileOffset = data.TargetFileOffset = offset
+        data.ByteCount = min(chunk, aligned_size - offset)
+        if not kernel32.DeviceIoControl(wintypes.HANDLE(msvcrt.get_osfhandle(dst.fileno())), _FSCTL_DUPLICATE_EXTENTS_TO_FILE,
+                                        ctypes.byref(data), ctypes.sizeof(data), None, 0, ctypes.byref(returned), None):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+def _reflink(src_path, dest_path):
+    """Creates dest_path as a copy-on-write clone of src_path: FICLONE on Linux
+    (btrfs, XFS, ...), block cloning on Windows (ReFS volumes and Dev Drives).
+
+    Raises:
+        OSError: If the platform or filesystem doesn't support reflinks.
+    """
+    if sys.platform == 'win32':
+        clone = lambda src, dst: _block_clone(src, dst, src_path)
+    elif fcntl is not None and sys.platform.startswith('linux'):
+        clone = lambda src, dst: fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    else:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+    try:
+        with open(src_path, 'rb') as src, open(dest_path, 'w+b') as dst:
+            clone(src, dst)
+    except OSError:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+
+def _copy_file(src_path, dest_path):
+    """Full copy of src_path to dest_path. Uses copy_file_range where available, which
+    copies inside the kernel and lets network filesystems copy server-side."""
+    if not hasattr(os, 'copy_file_range'):
+        shutil.copyfile(src_path, dest_path)
+        return
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as dst:
+        try:
+            size = os.fstat(src.fileno()).st_size
+            copied = 0
+            while copied < size:
+                count = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+                if count == 0:
+                    break
+                copied += count
+            if copied == size:
+                return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+                raise
+        src.seek(0)
+        dst.seek(0)
+        dst.truncate()
+        shutil.copyfileobj(src, dst)
+
+def detect_link_mode(directory):
+    """Returns how files can be snapshotted into directory: 'reflink', 'hardlink' or 'copy'.
+
+    Follows the archive_link_mode setting. 'auto' only chooses between a
+    reflink, where the volume supports it, and a full copy: both leave the
+    archive untouched when the live file is later written in place. Hard
+    links share the live file's data, so they are only used when set
+    explicitly. Each volume is probed once with a throwaway file.
+    """
+    configured = config_manager.get_archive_link_mode()
+    if configured == 'copy':
+        return 'copy'
+    key = (os.stat(directory).st_dev, configured)
+    with _link_modes_lock:
+        if key in _link_modes:
+            return _link_modes[key]
+        probe = os.path.join(directory, f".probe-{uuid.uuid4().hex[:8]}")
+        mode = 'copy'
+        try:
+            with open(probe, 'wb') as f:
+                f.write(b'probe')
+            for candidate, snapshot in (('reflink', _reflink), ('hardlink', os.link)):
+                if configured != candidate and not (configured == 'auto' and candidate == 'reflink'):
+                    continue
+                try:
+                    snapshot(probe, probe + '.snap')
+                    mode = candidate
+                    break
+                except OSError:
+                    continue
+                finally:
+                    if os.path.exists(probe + '.snap'):
+                        os.remove(probe + '.snap')
+        finally:
+            if os.path.exists(probe):
+                os.remove(probe)
+        _link_modes[key] = mode
+        logger.debug(f"Archive snapshot mode for {directory}: {mode}")
+        if mode == 'hardlink':
+            logger.warning("Archiving with hard links: any in-place write to an installed file (script "
+                           "settings, user edits) also changes its archived copy and makes that version unrestorable.")
+        return mode
+
+def snapshot_file(src_path, dest_path, mode):
+    """Creates dest_path (which must not exist) with src_path's content, sharing
+    storage when mode allows and falling back to a full copy."""
+    if mode == 'hardlink':
+        try:
+            os.link(src_path, dest_path)
+            return
+        except OSError:
+            pass
+    elif mode == 'reflink':
+        try:
+            _reflink(src_path, dest_path)
+            return
+        except OSError:
+            pass
+    _copy_file(src_path, dest_path)
+
+def _zip_mtime_ns(info):
+    return int(time.mktime(info.date_time + (0, 0, -1))) * 1_000_000_000
+
+def _store_lock(versions_dir):
+    key = os.path.normcase(os.path.abspath(versions_dir))
+    with _store_locks_lock:
+        return _store_locks.setdefault(key, threading.RLock())
+
+def parse_version_name(name):
+    """Splits '<YYYY-mm-dd_HH-MM-SS>_<sha8 or "active">_<context>' into (timestamp, sha8, context).
+    Parts that don't parse come back as None."""
+    parts = name.split('_', 3)
+    if len(parts) != 4:
+        return None, None, None
+    try:
+        timestamp = datetime.strptime(f"{parts[0]}_{parts[1]}", "%Y-%m-%d_%H-%M-%S").timestamp()
+    except ValueError:
+        return None, None, None
+    return timestamp, (parts[2] if parts[2] != 'active' else None), parts[3]
+
+def _index_entry(manifest, kind):
+    return {'id': manifest['id'], 'sha': manifest.get('sha'), 'timestamp': manifest.get('created'),
+            'context': manifest.get('context'), 'kind': kind, 'files': len(manifest['files']),
+            'bytes': sum(entry['size'] for entry in manifest['files'].values())}
+
+def select_evictions(entries, policy):
+    """Returns the ids of the versions the count rules of a retention policy don't keep.
+
+    entries are index entries, newest first. A version is kept if it is one of
+    the keep_last newest, or the newest of its day (week) among the keep_daily
+    (keep_weekly) most recent days (weeks) that have versions. Without any count
+    rule every version is kept.
+    """
+    rules = [policy.get(rule) for rule in ('keep_last', 'keep_daily', 'keep_weekly')]
+    if all(rule is None for rule in rules):
+        return []
+    keep_last, keep_daily, keep_weekly = rules
+    keep = {entry['id'] for entry in entries[:keep_last or 0]}
+    for periods, period_format in ((keep_daily, "%Y-%m-%d"), (keep_weekly, "%G-W%V")):
+        if not periods:
+            continue
+        seen = set()
+        for entry in entries:
+            period = time.strftime(period_format, time.localtime(entry['timestamp'] or 0))
+            if period in seen:
+                continue
+            if len(seen) == periods:
+                break
+            seen.add(period)
+            keep.add(entry['id'])
+    return [entry['id'] for entry in entries if entry['id'] not in keep]
+
+def tree_hashes(script_path):
+    """Returns {rel_path: git blob SHA} for a script's live tree, reusing the hashes
+    cached in its file manifest so only files changed since then are read."""
+    files, _ = list_tree(script_path)
+    manifest = file_manifest.load_manifest(script_path)
+    hashes = manifest.get_hashes(files, HASH_ALGO)
+    manifest.save()
+    return hashes
+
+
+class VersionStore:
+    """Content-addressed archive of a script's past versions.
+
+    Every archived file is stored once under "Older Versions/.store/objects",
+    named by its content hash, and each version is a small JSON manifest in
+    "Older Versions/.store/versions" mapping relative paths to blobs. Versions
+    that share files share blobs, so archiving writes only the blobs that are
+    not stored yet, and restoring materialises a manifest from the blobs.
+
+    Every version is listed in "Older Versions/.index.json" with its full SHA,
+    timestamp, context, file count and size, so listing versions and finding
+    one by SHA read one small file instead of scanning the folder. The index
+    is rewritten atomically on every change and rebuilt from disk (including
+    legacy version folders) when it is missing or unreadable.
+
+    With the archive_format setting at 'pack', new versions are written as
+    one compressed zip each instead ("Older Versions/<version_id>.zip"). Both
+    kinds can be listed, read file by file and restored through this class.
+
+    New blobs are reflinked from the live tree where the volume supports it
+    (see detect_link_mode), otherwise copied, so writes to the live files
+    never reach the archive. Hard links are an explicit opt-in: a hard-linked
+    blob changes whenever its live file is written in place, so blobs that are
+    still linked are verified before they are restored.
+    """
+
+    def __init__(self, script_path):
+        self.script_path = script_path
+        self.versions_dir = os.path.join(script_path, OLDER_VERSIONS_DIR)
+        self.store_dir = os.path.join(self.versions_dir, STORE_DIR)
+        self.objects_dir = os.path.join(self.store_dir, 'objects')
+        self.manifests_dir = os.path.join(self.store_dir, 'versions')
+        self.index_path = os.path.join(self.versions_dir, INDEX_FILE)
+        # Held while archiving, restoring, pruning and rewriting the index
+        self._lock = _store_lock(self.versions_dir)
+
+    def locked(self):
+        """Returns this script's archive lock (re-entrant) for use in a with block, e.g. to move
+        "Older Versions" without a concurrent archive or prune writing into it."""
+        return self._lock
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def manifest_path(self, version_id):
+        return os.path.join(self.manifests_dir, f"{version_id}.json")
+
+    def pack_path(self, version_id):
+        return os.path.join(self.versions_dir, version_id + PACK_SUFFIX)
+
+    def version_path(self, version_id):
+        """Returns the file holding a version: its pack, else its blob-store manifest."""
+        pack_path = self.pack_path(version_id)
+        return pack_path if os.path.isfile(pack_path) else self.manifest_path(version_id)
+
+    def has_version(self, version_id):
+        return os.path.isfile(self.manifest_path(version_id)) or os.path.isfile(self.pack_path(version_id))
+
+    def list_versions(self):
+        """Returns the ids of all versions in the store and in packs (unordered)."""
+        versions = []
+        if os.path.isdir(self.manifests_dir):
+            versions.extend(name[:-len('.json')] for name in os.listdir(self.manifests_dir) if name.endswith('.json'))
+        if os.path.isdir(self.versions_dir):
+            versions.extend(name[:-len(PACK_SUFFIX)] for name in os.listdir(self.versions_dir)
+                            if name.endswith(PACK_SUFFIX) and os.path.isfile(os.path.join(self.versions_dir, name)))
+        return versions
+
+    def _read_index(self):
+        # Returns the index data, rebuilding it if it is missing or unreadable.
+        with self._lock:
+            try:
+                with open(self.index_path, 'r') as f:
+                    data = json.load(f)
+                if isinstance(data.get('versions'), dict) and isinstance(data.get('by_sha'), dict):
+                    return data
+                logger.warning(f"Version index {self.index_path} is malformed; rebuilding it.")
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"Version index {self.index_path} is unreadable ({e}); rebuilding it.")
+            return self._rebuild_index()
+
+    def _write_index(self, versions):
+        # Caller holds the index lock.
+        by_sha = {entry['sha'][:8]: version_id for version_id, entry in versions.items() if entry.get('sha')}
+        data = {'versions': versions, 'by_sha': by_sha}
+        temp_path = f"{self.index_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.index_path)
+        return data
+
+    def _update_index(self, put=None, remove=()):
+        """Adds the entries in put ({version_id: entry}) and drops the ids in remove,
+        as one read-modify-replace under the store lock."""
+        with self._lock:
+            versions = self._read_index()['versions']
+            versions.update(put or {})
+            for version_id in remove:
+                versions.pop(version_id, None)
+            self._write_index(versions)
+
+    def _rebuild_index(self):
+        """Recreates the index from the store manifests, packs and legacy version folders."""
+        if not os.path.isdir(self.versions_dir):
+            return {'versions': {}, 'by_sha': {}}
+        versions = {}
+        for version_id in self.list_versions():
+            try:
+                kind = 'pack' if os.path.isfile(self.pack_path(version_id)) else 'store'
+                versions[version_id] = _index_entry(self.read_manifest(version_id), kind)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable archived version {version_id}: {e}")
+        for name in os.listdir(self.versions_dir):
+            folder = os.path.join(self.versions_dir, name)
+            if name.startswith('.') or not os.path.isdir(folder):
+                continue
+            timestamp, sha_short, context = parse_version_name(name)
+            files, _ = list_tree(folder)
+            versions[name] = {'id': name, 'sha': sha_short, 'timestamp': timestamp or os.path.getctime(folder),
+                              'context': context, 'kind': 'folder', 'files': len(files),
+                              'bytes': sum(os.path.getsize(os.path.join(folder, rel)) for rel in files)}
+        logger.info(f"Rebuilt version index for {self.script_path}: {len(versions)} versions")
+        with self._lock:
+            return self._write_index(versions)
+
+    def list_entries(self):
+        """Returns the index entries of all archived versions, newest first.
+
+        Each entry holds id, sha (full, or 8 characters for legacy folders),
+        timestamp, context, kind ('store', 'pack' or 'folder'), files and bytes.
+        """
+        versions = self._read_index()['versions']
+        return sorted(versions.values(), key=lambda entry: entry['timestamp'] or 0, reverse=True)
+
+    def find_by_sha(self, sha):
+        """Returns the id of the version archived from commit sha (full or at least 8 characters), or None."""
+        return self._read_index()['by_sha'].get(sha[:8])
+
+    def read_manifest(self, version_id):
+        """Returns a version's manifest: id, sha, context, created and files
+        ({rel_path: {'size', 'mtime_ns'}}, plus 'hash' for blob-store versions).
+
+        Raises:
+            OSError: If the version doesn't exist or can't be read.
+            ValueError: If the manifest or pack is corrupt.
+        """
+        if os.path.isfile(self.pack_path(version_id)):
+            try:
+                with zipfile.ZipFile(self.pack_path(version_id)) as zf:
+                    manifest = json.loads(zf.comment.decode('utf-8'))
+                    manifest['files'] = {info.filename: {'size': info.file_size, 'mtime_ns': _zip_mtime_ns(info)}
+                                         for info in zf.infolist() if not info.is_dir()}
+                    manifest['dirs'] = [info.filename.rstrip('/') for info in zf.infolist() if info.is_dir()]
+                    return manifest
+            except zipfile.BadZipFile as e:
+                raise ValueError(f"Corrupt version pack {version_id}: {e}")
+        with open(self.manifest_path(version_id), 'r') as f:
+            return json.load(f)
+
+    def _put_blob(self, src_path, digest, consume, mode):
+        # Returns True if a new blob was written, False if one with this content already existed.
+        dest = self._object_path(digest)
+        if os.path.exists(dest):
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if consume:
+            os.replace(src_path, dest)
+        else:
+            temp_path = f"{dest}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                snapshot_file(src_path, temp_path, mode)
+                os.replace(temp_path, dest)
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return True
+
+    def archive(self, source_dir, version_id, sha=None, context=None, hashes=None, consume=False):
+        """Stores the tree at source_dir as a new version, in the blob store or as
+        a pack depending on the archive_format setting.
+
+        Args:
+            hashes (dict): Known {rel_path: git blob SHA} for files in source_dir
+                (see tree_hashes); anything missing is hashed here. Not needed for packs.
+            consume (bool): Move new blobs out of source_dir instead of copying
+                them. For trees that are deleted afterwards, e.g. one just
+                replaced by an update.
+
+        Returns:
+            dict: The version manifest (see read_manifest).
+
+        Raises:
+            OSError: If a file can't be hashed or stored.
+        """
+        with self._lock:
+            if config_manager.get_archive_format() == 'pack':
+                manifest, kind = self._archive_pack(source_dir, version_id, sha, context), 'pack'
+            else:
+                manifest, kind = self._archive_blobs(source_dir, version_id, sha, context, hashes, consume), 'store'
+            self._update_index(put={version_id: _index_entry(manifest, kind)})
+        return manifest
+
+    def _archive_blobs(self, source_dir, version_id, sha, context, hashes, consume):
+        files, empty_dirs = list_tree(source_dir)
+        hashes = dict(hashes or {})
+        missing = {os.path.join(source_dir, rel.replace('/', os.sep)): rel for rel in files if rel not in hashes}
+        if missing:
+            for local_path, digest in hashing.hash_files(missing, HASH_ALGO).items():
+                if digest is None:
+                    raise OSError(f"Could not hash {local_path}")
+                hashes[missing[local_path]] = digest
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        mode = 'move' if consume else detect_link_mode(self.objects_dir)
+        entries = {}
+        new_blobs = new_bytes = 0
+        for rel in files:
+            local_path = os.path.join(source_dir, rel.replace('/', os.sep))
+            st = os.stat(local_path)
+            entries[rel] = {'hash': hashes[rel], 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            if self._put_blob(local_path, hashes[rel], consume, mode):
+                new_blobs += 1
+                new_bytes += st.st_size
+
+        manifest = {'id': version_id, 'sha': sha, 'context': context, 'created': time.time(),
+                    'files': entries, 'dirs': empty_dirs}
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        temp_path = self.manifest_path(version_id) + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path(version_id))
+        logger.info(f"Archived version {version_id}: {len(entries)} files, {new_blobs} new blobs "
+                    f"({new_bytes} bytes, {mode})")
+        return manifest
+
+    def _archive_pack(self, source_dir, version_id, sha, context):
+        files, empty_dirs = list_tree(source_dir)
+        header = {'id': version_id, 'sha': sha, 'context': context, 'created': time.time()}
+        pack_path = self.pack_path(version_id)
+        os.makedirs(self.versions_dir, exist_ok=True)
+        temp_path = pack_path + '.tmp'
+        try:
+            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=PACK_COMPRESSLEVEL,
+                                 strict_timestamps=False) as zf:
+                for rel in empty_dirs:
+                    zf.write(os.path.join(source_dir, rel.replace('/', os.sep)), rel + '/')
+                for rel in files:
+                    zf.write(os.path.join(source_dir, rel.replace('/', os.sep)), rel)
+                zf.comment = json.dumps(header).encode('utf-8')
+            os.replace(temp_path, pack_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logger.info(f"Archived version {version_id} as a pack: {len(files)} files, {os.path.getsize(pack_path)} bytes")
+        return self.read_manifest(version_id)
+
+    def _restore_pack(self, version_id, dest_dir):
+        dest_root = os.path.abspath(dest_dir)
+        count = 0
+        with zipfile.ZipFile(self.pack_path(version_id)) as zf:
+            for info in zf.infolist():
+                local_path = os.path.abspath(os.path.join(dest_root, info.filename.rstrip('/').replace('/', os.sep)))
+                if not local_path.startswith(dest_root + os.sep):
+                    raise OSError(f"Unsafe path in version pack {version_id}: {info.filename}")
+                if info.is_dir():
+                    os.makedirs(local_path, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                with zf.open(info) as src, open(local_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 64 * 1024)
+                mtime_ns = _zip_mtime_ns(info)
+                os.utime(local_path, ns=(mtime_ns, mtime_ns))
+                count += 1
+        return count
+
+    def _verify_linked_blobs(self, digests):
+        # Blobs with other hard links may have been edited through them; re-hash those.
+        linked = [self._object_path(digest) for digest in digests if os.stat(self._object_path(digest)).st_nlink > 1]
+        for blob_path, digest in hashing.hash_files(linked, HASH_ALGO).items():
+            if digest != os.path.basename(blob_path):
+                raise OSError(f"Archived file {os.path.basename(blob_path)} was modified through a hard link")
+
+    def restore(self, version_id, dest_dir):
+        """Materialises a version into dest_dir (which should be empty), keeping archived mtimes.
+
+        Packs are stream-extracted member by member. Blob-store files are
+        reflinked where possible, otherwise copied, so the restored tree never
+        shares an inode with the store.
+
+        Returns:
+            int: The number of files written.
+
+        Raises:
+            OSError: If the version or one of its blobs is missing or damaged.
+            ValueError: If the manifest is corrupt.
+        """
+        with self._lock:
+            if os.path.isfile(self.pack_path(version_id)):
+                return self._restore_pack(version_id, dest_dir)
+            manifest = self.read_manifest(version_id)
+            self._verify_linked_blobs({entry['hash'] for entry in manifest['files'].values()})
+            mode = 'reflink' if detect_link_mode(dest_dir) == 'reflink' else 'copy'
+            for rel in manifest.get('dirs', []):
+                os.makedirs(os.path.join(dest_dir, rel.replace('/', os.sep)), exist_ok=True)
+            for rel, entry in manifest['files'].items():
+                local_path = os.path.join(dest_dir, rel.replace('/', os.sep))
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                snapshot_file(self._object_path(entry['hash']), local_path, mode)
+                os.utime(local_path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+            return len(manifest['files'])
+
+    def _blob_sizes(self, version_id):
+        # {blob hash: size} of a blob-store version; empty if its manifest can't be read.
+        try:
+            return {entry['hash']: entry['size'] for entry in self.read_manifest(version_id)['files'].values()}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read archived version {version_id}: {e}")
+            return {}
+
+    def _budget_evictions(self, kept, max_bytes):
+        """Returns the ids, oldest first, to evict from kept (index entries, newest
+        first) until the versions left fit in max_bytes on disk. Blobs shared by
+        several versions count once; the newest version is never evicted."""
+        refs = {}        # blob hash -> number of kept versions using it
+        blob_sizes = {}  # blob hash -> size
+        version_blobs = {}
+        own_bytes = {}   # version id -> bytes not shared with other versions (packs, folders)
+        for entry in kept:
+            if entry['kind'] == 'store':
+                version_blobs[entry['id']] = self._blob_sizes(entry['id'])
+                for digest, size in version_blobs[entry['id']].items():
+                    refs[digest] = refs.get(digest, 0) + 1
+                    blob_sizes[digest] = size
+            elif entry['kind'] == 'pack':
+                pack_path = self.pack_path(entry['id'])
+                own_bytes[entry['id']] = os.path.getsize(pack_path) if os.path.isfile(pack_path) else 0
+            else:
+                own_bytes[entry['id']] = entry['bytes']
+
+        usage = sum(blob_sizes.values()) + sum(own_bytes.values())
+        evicted = []
+        for entry in reversed(kept[1:]):
+            if usage <= max_bytes:
+                break
+            evicted.append(entry['id'])
+            usage -= own_bytes.get(entry['id'], 0)
+            for digest in version_blobs.get(entry['id'], {}):
+                refs[digest] -= 1
+                if refs[digest] == 0:
+                    usage -= blob_sizes[digest]
+        return evicted
+
+    def _delete_version_files(self, entry):
+        # Removes a version's manifest, pack or folder; returns the bytes freed (blobs aside).
+        if entry['kind'] == 'folder':
+            folder = os.path.join(self.versions_dir, entry['id'])
+            shutil.rmtree(folder, ignore_errors=True)
+            return 0 if os.path.exists(folder) else entry['bytes']
+        path = self.pack_path(entry['id']) if entry['kind'] == 'pack' else self.manifest_path(entry['id'])
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except OSError as e:
+            logger.warning(f"Could not delete archived version {entry['id']}: {e}")
+            return 0
+
+    def collect_garbage(self):
+        """Deletes blobs no store manifest references any more, and leftover temp files.
+
+        Nothing is deleted if any manifest can't be read, since its blobs would
+        look unreferenced.
+
+        Returns:
+            int: Bytes freed.
+        """
+        with self._lock:
+            if not os.path.isdir(self.objects_dir):
+                return 0
+            referenced = set()
+            for version_id in self.list_versions():
+                if os.path.isfile(self.pack_path(version_id)):
+                    continue
+                try:
+                    referenced.update(entry['hash'] for entry in self.read_manifest(version_id)['files'].values())
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping blob cleanup: archived version {version_id} can't be read ({e})")
+                    return 0
+            freed = 0
+            for dirpath, _, filenames in os.walk(self.objects_dir):
+                for filename in filenames:
+                    if filename in referenced:
+                        continue
+                    blob_path = os.path.join(dirpath, filename)
+                    try:
+                        size = os.path.getsize(blob_path)
+                        os.remove(blob_path)
+                        freed += size
+                    except OSError as e:
+                        logger.debug(f"Could not delete unused blob {blob_path}: {e}")
+            return freed
+
+    def prune(self, policy):
+        """Evicts the versions a retention policy doesn't keep, then unused blobs.
+
+        Count rules (keep_last, keep_daily, keep_weekly; see select_evictions) go
+        first, then the oldest remaining versions are evicted until the archive
+        fits in max_bytes. Evicted versions leave the index before their files
+        are deleted.
+
+        Returns:
+            tuple: (list, int) the evicted version ids and the bytes reclaimed
+        """
+        with self._lock:
+            entries = self.list_entries()
+            evicted = set(select_evictions(entries, policy))
+            if policy.get('max_bytes') is not None:
+                kept = [entry for entry in entries if entry['id'] not in evicted]
+                evicted.update(self._budget_evictions(kept, policy['max_bytes']))
+            if not evicted:
+                return [], 0
+            self._update_index(remove=evicted)
+            reclaimed = sum(self._delete_version_files(entry) for entry in entries if entry['id'] in evicted)
+            reclaimed += self.collect_garbage()
+        return sorted(evicted), reclaimed